@@ -1,5 +1,9 @@
 
+from . import precision
 from . import features
+from . import corpus
+from . import io
+from . import online
 
 from .models import NormalDiagonalCovariance
 from .models import NormalFullCovariance
@@ -8,7 +12,9 @@ from .models import Mixture
 from .training import train_vae, train_loglinear_model
 
 from .expfamily import ExpFamilyDensity
+from .expfamily import BatchExpFamilyDensity
 from .expfamily import kl_div
+from .expfamily import pairwise_kl_div
 from .expfamily import DirichletPrior
 from .expfamily import NormalGammaPrior
 from .expfamily import NormalWishartPrior
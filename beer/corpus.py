@@ -0,0 +1,126 @@
+'''Feature extraction over a whole corpus.'''
+
+
+import multiprocessing
+import os
+import numpy as np
+import scipy.io.wavfile
+
+from . import features
+from .io import FeatureArchiveWriter
+
+
+def read_audio(path):
+    '''Load the samples of an audio file.
+
+    Args:
+        path (string): Path to a WAV file or to a numpy array saved
+            with ``numpy.save`` (".npy" extension).
+
+    Returns:
+        numpy.ndarray: The audio samples.
+
+    '''
+    if path.endswith('.npy'):
+        return np.load(path)
+    _, signal = scipy.io.wavfile.read(path)
+    return signal
+
+
+def _extract_utterance(job):
+    # The new features are returned with their cache key (None if there
+    # is nothing to cache) to be stored by the main process.
+    uttid, path, fea_args, winlens, cache = job
+    store_key = None
+    try:
+        signal = read_audio(path)
+        key = cache.key(signal, winlens, **fea_args) if cache is not None \
+            else None
+        fea = cache.load(key) if key is not None else None
+        if fea is None:
+            fea = features.fbank(signal, **fea_args)
+            if winlens:
+                fea = features.add_deltas(fea, winlens)
+            store_key = key
+    except Exception as error:
+        return uttid, None, '{}: {}'.format(type(error).__name__, error), None
+    return uttid, fea, None, store_key
+
+
+def extract_corpus(utterances, outdir, nworkers=1, fea_args={},
+                   winlens=(2, 2), chunksize=8, archive=False, quantize=None,
+                   cache=None, callback=None):
+    '''Extract the FBANK features (and their derivatives) of a list of
+    utterances using a pool of processes.
+
+    The features of each utterance are stored in
+    ``<outdir>/<uttid>.npy`` or, if ``archive=True``, in a single
+    features archive ``<outdir>/feats`` (see :mod:`beer.io`). The
+    utterances are processed in parallel but the results are written
+    in the order of the input list.
+
+    Note:
+        Each worker runs single-threaded numpy code so set
+        ``OMP_NUM_THREADS=1`` (or equivalent for your BLAS library)
+        before starting python to avoid over-subscribing the cores
+        when ``nworkers`` is large.
+
+    Args:
+        utterances (list): List of (utterance-id, audio path) pairs.
+        outdir (string): Output directory (created if needed).
+        nworkers (int): Number of worker processes.
+        fea_args (dict): Extra arguments for :func:`beer.features.fbank`.
+        winlens (tuple): Window lengths for :func:`beer.features.add_deltas`.
+            Set to None or () to skip the derivatives.
+        chunksize (int): Number of utterances sent at once to a worker.
+        archive (boolean): Store the features in a single archive.
+        quantize (numpy.dtype): Quantize the features stored in the
+            archive (see :class:`beer.io.FeatureArchiveWriter`).
+        cache (``beer.io.FeatureCache``): Cache of the features. The
+            utterances already in the cache are not re-extracted. The
+            new features are stored by the calling process so that the
+            estimate of the size of the cache is kept across the jobs.
+        callback (function): Called after each utterance as
+            ``callback(count, total, uttid, error)`` where ``error`` is
+            None if the extraction succeeded.
+
+    Returns:
+        dict: Error message for each utterance that failed.
+
+    '''
+    os.makedirs(outdir, exist_ok=True)
+    jobs = [(uttid, path, fea_args, winlens, cache)
+            for uttid, path in utterances]
+    failures = {}
+
+    def process(results, writer):
+        for count, (uttid, fea, error, key) in enumerate(results, start=1):
+            if key is not None:
+                try:
+                    cache.store(key, fea)
+                except Exception as store_error:
+                    error = '{}: {}'.format(type(store_error).__name__,
+                                            store_error)
+            if error is None and writer is not None:
+                writer.write(uttid, fea)
+            elif error is None:
+                np.save(os.path.join(outdir, uttid + '.npy'), fea)
+            else:
+                failures[uttid] = error
+            if callback is not None:
+                callback(count, len(jobs), uttid, error)
+
+    writer = FeatureArchiveWriter(os.path.join(outdir, 'feats'), quantize) \
+        if archive else None
+    try:
+        if nworkers > 1:
+            with multiprocessing.Pool(nworkers) as pool:
+                process(pool.imap(_extract_utterance, jobs,
+                                  chunksize=chunksize), writer)
+        else:
+            process(map(_extract_utterance, jobs), writer)
+    finally:
+        if writer is not None:
+            writer.close()
+
+    return failures
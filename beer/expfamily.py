@@ -7,17 +7,23 @@ import math
 import torch
 import torch.autograd as ta
 
+from .precision import stats_dtype
+
 
 def _bregman_divergence(F_p, F_q, grad_F_q, p, q):
-    return F_p - F_q - grad_F_q @ (p - q)
+    return F_p - F_q - (grad_F_q * (p - q)).sum(dim=-1)
 
 
 def _exp_stats_and_log_norm(natural_params, log_norm_fn):
-    if natural_params.grad is not None:
-        natural_params.grad.zero_()
+    natural_params = natural_params.detach().requires_grad_()
     log_norm = log_norm_fn(natural_params)
-    ta.backward(log_norm)
-    return natural_params.grad, log_norm
+    ta.backward(log_norm.sum())
+    return natural_params.grad, log_norm.detach()
+
+
+def _closed_form_exp_stats_and_log_norm(natural_params, exp_stats_fn):
+    with torch.no_grad():
+        return exp_stats_fn(natural_params.detach())
 
 
 ########################################################################
@@ -29,6 +35,14 @@ def _dirichlet_log_norm(natural_params):
         + torch.lgamma(natural_params + 1).sum()
 
 
+def _dirichlet_exp_stats_and_log_norm(natural_params):
+    counts = natural_params + 1
+    total = counts.sum(dim=-1, keepdim=True)
+    exp_stats = torch.digamma(counts) - torch.digamma(total)
+    log_norm = - torch.lgamma(total[..., 0]) + torch.lgamma(counts).sum(dim=-1)
+    return exp_stats, log_norm
+
+
 def _normalgamma_log_norm(natural_params):
     np1, np2, np3, np4 = natural_params.view(4, -1)
     lognorm = torch.lgamma(.5 * (np4 + 1))
@@ -37,80 +51,323 @@ def _normalgamma_log_norm(natural_params):
     return torch.sum(lognorm)
 
 
-def _normalwishart_split_nparams(natural_params):
+def _normalgamma_exp_stats_and_log_norm(natural_params):
+    np1, np2, np3, np4 = natural_params.reshape(*natural_params.shape[:-1],
+                                                4, -1).unbind(dim=-2)
+    shape = .5 * (np4 + 1)
+    rate = .5 * (np1 - ((np2**2) / np3))
+    mean = np2 / np3
+    exp_stats = torch.cat([
+        -.5 * shape / rate,
+        mean * shape / rate,
+        -.5 / np3 - .5 * (mean**2) * shape / rate,
+        .5 * torch.digamma(shape) - .5 * torch.log(rate)
+    ], dim=-1)
+    log_norm = torch.sum(torch.lgamma(shape) - .5 * torch.log(np3) \
+        - shape * torch.log(rate), dim=-1)
+    return exp_stats, log_norm
+
+
+def _pack_symmetric(matrices):
+    # Upper-triangular part (row major) of a stack of symmetric
+    # (D x D) matrices: (..., D, D) -> (..., D(D+1)/2).
+    rows, cols = torch.triu_indices(matrices.size(-1), matrices.size(-1))
+    return matrices[..., rows, cols]
+
+
+def _unpack_symmetric(packed, D):
+    # Inverse of "_pack_symmetric". The off-diagonal entries are
+    # copied in both triangles so the gradient w.r.t. them is the sum
+    # of the gradients of the two (i, j) and (j, i) entries.
+    rows, cols = torch.triu_indices(D, D)
+    matrices = packed.new_zeros(*packed.shape[:-1], D, D)
+    matrices[..., rows, cols] = packed
+    matrices[..., cols, rows] = packed
+    return matrices
+
+
+def _symmetric_weights(D, dtype=None):
+    # Weights of the packed entries in the inner product of two
+    # symmetric matrices: 1 for the diagonal, 2 for the off-diagonal.
+    rows, cols = torch.triu_indices(D, D)
+    return (2 - (rows == cols).long()).to(dtype or stats_dtype())
+
+
+def _normalwishart_split_nparams(natural_params, exp_stats=False):
     # We need to retrieve the 4 natural parameters organized as
     # follows:
-    #   [ np1_1, ..., np1_D^2, np2_1, ..., np2_D, np3, np4]
+    #   [ np1_1, ..., np1_D(D+1)/2, np2_1, ..., np2_D, np3, np4]
+    # where the first parameter is the packed upper-triangular part of
+    # a symmetric (D x D) matrix (see "_pack_symmetric").
     #
     # The dimension D is found by solving the polynomial:
-    #   D^2 + D - len(self.natural_params[:-2]) = 0
-    D = int(.5 * (-1 + math.sqrt(1 + 4 * len(natural_params[:-2]))))
-    np1, np2 = natural_params[:int(D**2)].view(D, D), \
-         natural_params[int(D**2):-2]
-    np3, np4 = natural_params[-2:]
+    #   D^2 + 3D + 4 - 2 * len(self.natural_params) = 0
+    #
+    # The natural parameters may have leading batch dimensions (e.g.
+    # K x P for K densities), the first parameter is then a stack of
+    # (D x D) matrices.
+    #
+    # The expected sufficient statistics (``exp_stats=True``) have the
+    # same layout but their off-diagonal terms are doubled as they
+    # appear twice in the inner product with the natural parameters.
+    D = int(round(.5 * (-3 + math.sqrt(8 * natural_params.size(-1) - 7))))
+    P = (D * (D + 1)) // 2
+    packed = natural_params[..., :P]
+    if exp_stats:
+        packed = packed / _symmetric_weights(D, packed.dtype)
+    np1 = _unpack_symmetric(packed, D)
+    np2 = natural_params[..., P:-2]
+    np3, np4 = natural_params[..., -2], natural_params[..., -1]
     return np1, np2, np3, np4, D
 
 
+def _normalwishart_cholesky(np1, np2, np3):
+    # Cholesky factor and log-determinant of the (D x D) matrices:
+    #   np1 - np2 np2^T / np3
+    mean = np2 / np3[..., None]
+    matrix = np1 - np2[..., :, None] * mean[..., None, :]
+    chol = torch.linalg.cholesky(matrix)
+    logdet = 2 * torch.log(torch.diagonal(chol, dim1=-2, dim2=-1)).sum(dim=-1)
+    return mean, chol, logdet
+
+
 def _normalwishart_log_norm(natural_params):
     np1, np2, np3, np4, D = _normalwishart_split_nparams(natural_params)
-    lognorm = .5 * ((np4 + D) * D * math.log(2) - D * torch.log(np3))
-    tmp = np1 - torch.ger(np2, np2) /np3
+    _, _, logdet = _normalwishart_cholesky(np1, np2, np3)
+    dof = np4 + D
+    seq = .5 * (dof[..., None] + 1 - torch.arange(1, D + 1, 1,
+                                                  dtype=natural_params.dtype))
+    return .5 * (dof * D * math.log(2) - D * torch.log(np3)) \
+        - .5 * dof * logdet + torch.lgamma(seq).sum(dim=-1)
 
-    # The following code compute the log of the determinant of a
-    # positive definite matrix. This is equivalent to:
-    #   >>> torch.log(torch.det(tmp))
-    # Note: the hook is necessary to correct the gradient as pytorch
-    # will return upper triangular gradient.
-    tmp.register_hook(lambda grad: .5 * (grad + grad.t()))
-    logdet = 2 * torch.log(torch.diag(torch.potrf(tmp))).sum()
 
-    lognorm += -.5 * (np4 + D) * logdet
-    seq = ta.Variable(torch.arange(1, D + 1, 1).type(natural_params.type()))
-    lognorm += torch.lgamma(.5 * (np4 + D + 1 - seq)).sum()
-    return lognorm
+def _normalwishart_exp_stats_and_log_norm(natural_params):
+    np1, np2, np3, np4, D = _normalwishart_split_nparams(natural_params)
+    mean, chol, logdet = _normalwishart_cholesky(np1, np2, np3)
+    inv_matrix = torch.cholesky_inverse(chol)
+    inv_mean = torch.cholesky_solve(mean[..., None], chol)[..., 0]
+    dof = np4 + D
+    seq = .5 * (dof[..., None] + 1 - torch.arange(1, D + 1, 1,
+                                                  dtype=natural_params.dtype))
+
+    exp_stats = torch.cat([
+        _pack_symmetric(-.5 * dof[..., None, None] * inv_matrix) \
+            * _symmetric_weights(D, natural_params.dtype),
+        dof[..., None] * inv_mean,
+        (-.5 * D / np3 - .5 * dof * (mean * inv_mean).sum(dim=-1))[..., None],
+        (.5 * torch.digamma(seq).sum(dim=-1) - .5 * logdet \
+            + .5 * D * math.log(2))[..., None]
+    ], dim=-1)
+    log_norm = .5 * (dof * D * math.log(2) - D * torch.log(np3)) \
+        - .5 * dof * logdet + torch.lgamma(seq).sum(dim=-1)
+    return exp_stats, log_norm
 
 
 class ExpFamilyDensity:
     '''General implementation of a member of a Exponential Family of
     Distribution.
 
-    '''
+    The expected value of the sufficient statistics is the gradient of
+    the log-normalizer w.r.t. the natural parameters. If the density
+    provides a closed-form expression of the gradient (``exp_stats_fn``)
+    it is used, otherwise the gradient is computed with autograd.
 
-    def __init__(self, natural_params, log_norm_fn):
-        # This will be initialized when setting the natural params
-        # property.
-        self._log_norm = None
-        self._expected_sufficient_statistics = None
-        self._natural_params = None
+    The log-normalizer and the expected sufficient statistics are
+    evaluated the first time they are accessed and cached until the
+    natural parameters change. Each change of the natural parameters
+    increments :attr:`version`. The natural parameters are stored with
+    the statistics type of :mod:`beer.precision`.
+
+    '''
 
+    def __init__(self, natural_params, log_norm_fn, exp_stats_fn=None):
         self._log_norm_fn = log_norm_fn
+        self._exp_stats_fn = exp_stats_fn
+        self._version = 0
         self.natural_params = natural_params
 
+    def _evaluate(self):
+        if self._log_norm is not None:
+            return
+        if self._exp_stats_fn is not None:
+            self._expected_sufficient_statistics, self._log_norm = \
+                _closed_form_exp_stats_and_log_norm(self._natural_params,
+                                                    self._exp_stats_fn)
+        else:
+            self._expected_sufficient_statistics, self._log_norm = \
+                _exp_stats_and_log_norm(self._natural_params,
+                                        self._log_norm_fn)
+
+    @property
+    def version(self):
+        'Number of times the natural parameters have been changed.'
+        return self._version
+
     @property
     def expected_sufficient_statistics(self):
         'Expected value of the sufficient statistics.'
-        return self._expected_sufficient_statistics.data
+        self._evaluate()
+        return self._expected_sufficient_statistics
 
     @property
     def log_norm(self):
         'Value of the log-partition function for the given parameters.'
-        return self._log_norm.data
+        self._evaluate()
+        return self._log_norm
 
     @property
     def natural_params(self):
         'Natural parameters of the density'
-        return self._natural_params.data
+        return self._natural_params
+
+    @natural_params.setter
+    def natural_params(self, value):
+        self._natural_params = value.detach().to(stats_dtype())
+        self._log_norm = None
+        self._expected_sufficient_statistics = None
+        self._version += 1
+
+    def autograd_expected_sufficient_statistics(self):
+        '''Expected value of the sufficient statistics computed with
+        autograd from the log-normalizer. This is slower than the
+        closed-form expression and is meant for checking it.
+
+        '''
+        exp_stats, _ = _exp_stats_and_log_norm(self.natural_params,
+                                               self._log_norm_fn)
+        return exp_stats
+
+
+class BatchExpFamilyDensity:
+    '''K densities of the same Exponential Family whose natural
+    parameters are stored as a single (K x P) matrix.
+
+    The log-normalizers and the expected sufficient statistics of all
+    the densities are computed at once with the closed-form
+    expressions of the family. As for :class:`ExpFamilyDensity`, they
+    are evaluated lazily and :attr:`version` is incremented each time
+    the natural parameters change.
+
+    Indexing the batch gives a view on one density which behaves as an
+    ``ExpFamilyDensity``: it always reflects the current parameters of
+    the batch and setting its natural parameters updates the batch.
+
+    '''
+
+    @staticmethod
+    def from_densities(densities):
+        '''Batch a list of densities of the same family.
+
+        Args:
+            densities (list): List of ``ExpFamilyDensity``.
+
+        Returns:
+            ``BatchExpFamilyDensity``: The batch of densities.
+
+        '''
+        log_norm_fn = densities[0]._log_norm_fn
+        exp_stats_fn = densities[0]._exp_stats_fn
+        for density in densities:
+            if density._exp_stats_fn is not exp_stats_fn:
+                raise ValueError('All the densities must be of the same type')
+        return BatchExpFamilyDensity(
+            torch.stack([density.natural_params for density in densities]),
+            log_norm_fn, exp_stats_fn)
+
+    def __init__(self, natural_params, log_norm_fn, exp_stats_fn):
+        if exp_stats_fn is None:
+            raise ValueError('Batched densities require a closed-form '
+                             'expression of the expected sufficient '
+                             'statistics')
+        self._log_norm_fn = log_norm_fn
+        self._exp_stats_fn = exp_stats_fn
+        self._version = 0
+        self.natural_params = natural_params
+
+    def __len__(self):
+        return len(self._natural_params)
+
+    def __getitem__(self, index):
+        if not -len(self) <= index < len(self):
+            raise IndexError('density index out of range')
+        return _BatchExpFamilyDensityItem(self, index % len(self))
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def _evaluate(self):
+        if self._log_norm is None:
+            self._expected_sufficient_statistics, self._log_norm = \
+                _closed_form_exp_stats_and_log_norm(self._natural_params,
+                                                    self._exp_stats_fn)
+
+    @property
+    def version(self):
+        'Number of times the natural parameters have been changed.'
+        return self._version
+
+    @property
+    def expected_sufficient_statistics(self):
+        'Expected value of the sufficient statistics (K x P).'
+        self._evaluate()
+        return self._expected_sufficient_statistics
+
+    @property
+    def log_norm(self):
+        'Value of the log-partition function of each density (K).'
+        self._evaluate()
+        return self._log_norm
+
+    @property
+    def natural_params(self):
+        'Natural parameters of the densities (K x P).'
+        return self._natural_params
+
+    @natural_params.setter
+    def natural_params(self, value):
+        self._natural_params = value.detach().to(stats_dtype())
+        self._log_norm = None
+        self._expected_sufficient_statistics = None
+        self._version += 1
+
+
+class _BatchExpFamilyDensityItem(ExpFamilyDensity):
+    'View on a density of a ``BatchExpFamilyDensity``.'
+
+    def __init__(self, batch, index):
+        self._batch = batch
+        self._index = index
+        self._log_norm_fn = batch._log_norm_fn
+        self._exp_stats_fn = batch._exp_stats_fn
+
+    @property
+    def version(self):
+        return self._batch.version
+
+    @property
+    def expected_sufficient_statistics(self):
+        return self._batch.expected_sufficient_statistics[self._index]
+
+    @property
+    def log_norm(self):
+        return self._batch.log_norm[self._index]
+
+    @property
+    def natural_params(self):
+        return self._batch.natural_params[self._index]
 
     @natural_params.setter
     def natural_params(self, value):
-        self._expected_sufficient_statistics, self._log_norm = \
-            _exp_stats_and_log_norm(value, self._log_norm_fn)
-        self._natural_params = value
+        natural_params = self._batch.natural_params.clone()
+        natural_params[self._index] = value.detach()
+        self._batch.natural_params = natural_params
 
 
 def kl_div(model1, model2):
     '''Kullback-Leibler divergence between two densities of the same
-    type.
+    type. If any of the two is a ``BatchExpFamilyDensity``, the
+    divergence of each density of the batch is returned.
 
     '''
     return _bregman_divergence(model2.log_norm, model1.log_norm,
@@ -118,6 +375,36 @@ def kl_div(model1, model2):
                                model2.natural_params, model1.natural_params)
 
 
+def pairwise_kl_div(densities, symmetric=True):
+    '''Kullback-Leibler divergence between all the pairs of densities
+    of a batch.
+
+    Args:
+        densities (``BatchExpFamilyDensity``): Batch of K densities.
+        symmetric (boolean): If True, return the symmetrized divergence
+            KL(p_i || p_j) + KL(p_j || p_i).
+
+    Returns:
+        Tensor: (K x K) matrix whose element (i, j) is the divergence
+            KL(p_i || p_j) (or its symmetrized version).
+
+    '''
+    log_norm = densities.log_norm
+    exp_stats = densities.expected_sufficient_statistics
+    # The divergence is invariant to a shift of the natural parameters;
+    # centering them limits the cancellation errors of the matrix
+    # product.
+    natural_params = densities.natural_params
+    natural_params = natural_params - natural_params.mean(dim=0)
+    kl_divs = log_norm[None, :] - log_norm[:, None] \
+        - exp_stats @ natural_params.t() \
+        + (exp_stats * natural_params).sum(dim=-1)[:, None]
+    if symmetric:
+        kl_divs = kl_divs + kl_divs.t()
+    kl_divs.fill_diagonal_(0.)
+    return kl_divs
+
+
 def DirichletPrior(prior_counts):
     '''Create a Dirichlet density function.
 
@@ -129,8 +416,8 @@ def DirichletPrior(prior_counts):
 
     '''
     natural_params = prior_counts - 1
-    natural_params = ta.Variable(natural_params, requires_grad=True)
-    return ExpFamilyDensity(natural_params, _dirichlet_log_norm)
+    return ExpFamilyDensity(natural_params, _dirichlet_log_norm,
+                            _dirichlet_exp_stats_and_log_norm)
 
 
 def NormalGammaPrior(mean, precision, prior_counts):
@@ -150,13 +437,14 @@ def NormalGammaPrior(mean, precision, prior_counts):
     n_precision = prior_counts * torch.ones_like(n_mean)
     g_shapes = precision * prior_counts
     g_rates = prior_counts
-    natural_params = ta.Variable(torch.cat([
+    natural_params = torch.cat([
         n_precision * (n_mean ** 2) + 2 * g_rates,
         n_precision * n_mean,
         n_precision,
         2 * g_shapes - 1
-    ]), requires_grad=True)
-    return ExpFamilyDensity(natural_params, _normalgamma_log_norm)
+    ])
+    return ExpFamilyDensity(natural_params, _normalgamma_log_norm,
+                            _normalgamma_exp_stats_and_log_norm)
 
 
 def NormalWishartPrior(mean, cov, prior_counts):
@@ -176,11 +464,12 @@ def NormalWishartPrior(mean, cov, prior_counts):
     D = mean.size(0)
     dof = prior_counts + D
     V = dof * cov
-    natural_params = ta.Variable(torch.cat([
-        (prior_counts * torch.ger(mean, mean) + V).view(-1),
+    natural_params = torch.cat([
+        _pack_symmetric(prior_counts * torch.outer(mean, mean) + V),
         prior_counts * mean,
         (torch.ones(1) * prior_counts).type(mean.type()),
         (torch.ones(1) * (dof - D)).type(mean.type())
-    ]), requires_grad=True)
-    return ExpFamilyDensity(natural_params, _normalwishart_log_norm)
+    ])
+    return ExpFamilyDensity(natural_params, _normalwishart_log_norm,
+                            _normalwishart_exp_stats_and_log_norm)
 
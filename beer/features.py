@@ -4,7 +4,12 @@
 
 from functools import lru_cache
 import numpy as np
+import scipy.fft
 import scipy.signal
+import scipy.sparse
+import torch
+
+from .precision import compute_dtype, stats_dtype
 
 
 def hz2mel(hz):
@@ -26,20 +31,10 @@ def bark2hz(bark):
     return (1960 * (bark + .53)) / (29.81 - bark - .53)
 
 
-def __triangle(center, a, b, x):
-    'Create triangular filter.'
-    slopes = 1. / (center - a), 1./ (b - center)
-    retval = np.zeros_like(x).astype(np.float)
-    idxs = np.logical_and(x >= a, x <= center)
-    retval[idxs] = np.linspace(slopes[0] * (x[idxs][0] - a), slopes[0] * (x[idxs][-1] - a), len(x[idxs]))
-    idxs = np.logical_and(x >= center, x <= b)
-    retval[idxs] = np.linspace(slopes[1] * (b - x[idxs][0]), slopes[1] * (b -x[idxs][-1]), len(x[idxs]))
-    return retval
-
-
 @lru_cache(maxsize=8)
 def create_fbank(nfilters, fft_len=512, srate=16000, lowfreq=0, highfreq=None,
-                 hz2scale=hz2mel, scale2hz=mel2hz, align_filt_center=True):
+                 hz2scale=hz2mel, scale2hz=mel2hz, align_filt_center=True,
+                 sparse=False):
     '''Create a set of triangular filter.
 
     Args:
@@ -52,9 +47,17 @@ def create_fbank(nfilters, fft_len=512, srate=16000, lowfreq=0, highfreq=None,
         scale2hz (function): Inversion function of ``hz2scale``.
         align_filt_center (boolean): Align the center of the filters to FFT
             frequency bin. Set to False for exact HTK FBANK features.
+        sparse (boolean): Return the filters as a sparse (CSR) matrix.
+            Each filter only covers the FFT bins between the centers
+            of its two neighbors so most of the matrix is zero. Note
+            that the dense (BLAS) product is faster for all the
+            usual filterbank sizes (see
+            ``benchmarks/bench_filterbank.py``) and is the one used by
+            the extraction functions.
 
     Returns
-        (numpy.ndarray): The filters organized as a matrix.
+        (numpy.ndarray): The filters organized as a matrix
+            (``scipy.sparse.csr_matrix`` if ``sparse=True``).
 
     '''
     highfreq = highfreq or srate / 2
@@ -65,10 +68,19 @@ def create_fbank(nfilters, fft_len=512, srate=16000, lowfreq=0, highfreq=None,
         centers = np.floor(fft_len * scale2hz(centers) / srate)
     else:
         centers = fft_len * scale2hz(centers) / srate
-    filters = np.zeros((nfilters, fft_len // 2))
-    for i in range(1, nfilters + 1):
-        filters[i - 1, :] = __triangle(centers[i], centers[i - 1], centers[i + 1],
-            np.arange(0, fft_len // 2))
+
+    # Build all the triangles at once: one row per filter.
+    bins = np.arange(0, fft_len // 2)[None, :]
+    lows, peaks, highs = centers[:-2, None], centers[1:-1, None], centers[2:, None]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rising = (bins - lows) / (peaks - lows)
+        falling = (highs - bins) / (highs - peaks)
+    filters = np.where((bins >= lows) & (bins < peaks), rising, 0.)
+    filters = np.where((bins > peaks) & (bins <= highs), falling, filters)
+    filters = np.where(bins == peaks, 1., filters)
+
+    if sparse:
+        return scipy.sparse.csr_matrix(filters)
     return filters
 
 
@@ -90,12 +102,320 @@ def add_deltas(fea, winlens=(2,2)):
         fea = np.r_[fea[[0]].repeat(wlen,0), fea, fea[[-1]].repeat(wlen,0)]
         fea = scipy.signal.lfilter(dfilter, 1, fea, 0)[2*wlen:]
         fea_list.append(fea)
-    return np.hstack(fea_list)
+    return np.hstack(fea_list).astype(compute_dtype(numpy=True), copy=False)
+
+
+@lru_cache(maxsize=64)
+def _delta_weights(winlens, length):
+    '''Weights of the derivatives as a function of the original
+    features for an utterance of ``length`` frames.
+
+    The derivative of order k at frame t is computed as:
+
+        sum_o weights[t, k, o] * fea[clip(t + o - L, 0, length - 1)]
+
+    where L = sum(winlens). The weights account for the replication
+    of the edge frames at every order as done by :func:`add_deltas`.
+
+    '''
+    offset = sum(winlens)
+    times = np.arange(length)[:, None]
+    offsets = np.arange(2 * offset + 1)[None, :]
+
+    # Order 0: the features themselves.
+    prev_weights = np.zeros((length, 2 * offset + 1))
+    prev_weights[:, offset] = 1.
+
+    weights = []
+    for wlen in winlens:
+        dfilter = np.arange(-wlen, wlen + 1)
+        dfilter = dfilter / (2 * dfilter.dot(dfilter))
+        order_weights = np.zeros_like(prev_weights)
+        for shift, coeff in zip(range(-wlen, wlen + 1), dfilter):
+            # Weights of the previous order at frame s = clip(t + shift)
+            # expressed relatively to frame t.
+            frames = np.clip(times + shift, 0, length - 1)
+            src = offsets - (frames - times)
+            valid = (src >= 0) & (src <= 2 * offset)
+            shifted = np.take_along_axis(prev_weights[frames[:, 0]],
+                                         np.clip(src, 0, 2 * offset), axis=-1)
+            order_weights += coeff * np.where(valid, shifted, 0.)
+        weights.append(order_weights)
+        prev_weights = order_weights
+    return np.stack(weights, axis=1)
+
+
+def _batch_delta_weights(winlens, lengths, nframes):
+    'Derivatives weights (see :func:`_delta_weights`) for a batch.'
+    offset = sum(winlens)
+    template = _delta_weights(winlens, 2 * offset + 1)
+
+    # Apart from the "offset" first and last frames, the weights are
+    # the same for all the frames of an utterance.
+    weights = np.zeros((len(lengths), nframes) + template.shape[1:])
+    if nframes > 2 * offset:
+        weights[:] = template[offset]
+        weights[:, :offset] = template[:offset]
+    for i, length in enumerate(lengths):
+        if length > 2 * offset:
+            weights[i, length - offset:length] = template[offset + 1:]
+        else:
+            weights[i, :length] = _delta_weights(winlens, int(length))
+    return weights
+
+
+def add_deltas_batch(fea, lengths=None, winlens=(2,2), out=None):
+    '''Add derivatives to a batch of padded features matrices.
+
+    All the derivative orders are computed in a single pass over the
+    (edge replicated) features: each order is expressed directly as a
+    weighted sum of the original frames so they don't depend on the
+    output of the previous order. The result is the same as calling
+    :func:`add_deltas` on each utterance.
+
+    Args:
+        fea (numpy.ndarray): Features as a (B x T x D) array.
+        lengths (numpy.ndarray): Number of valid frames of each
+            utterance (default: T for all).
+        winlens: tuple with window lengths for deltas, double deltas,
+            ... default is (2,2)
+        out (numpy.ndarray): Optional output array of shape
+            (B x T x D * (1 + len(winlens))).
+
+    Returns:
+        numpy.ndarray: Features augmented with derivatives. The frames
+            beyond the length of an utterance are set to zero.
+
+    '''
+    nutts, nframes, dim = fea.shape
+    lengths = np.full(nutts, nframes) if lengths is None else np.asarray(lengths)
+    winlens, offset = tuple(winlens), sum(winlens)
+    if out is None:
+        out = np.empty((nutts, nframes, dim * (1 + len(winlens))),
+                       dtype=compute_dtype(numpy=True))
+    out[:, :, :dim] = fea
+
+    if len(winlens) > 0 and nframes > 0:
+        # Sliding windows over the utterances padded by replicating
+        # their first and last valid frame: (B x T x D x 2L+1).
+        idxs = np.clip(np.arange(-offset, nframes + offset)[None, :], 0,
+                       np.maximum(lengths - 1, 0)[:, None])
+        padded_fea = fea[np.arange(nutts)[:, None], idxs]
+        windows = np.lib.stride_tricks.sliding_window_view(padded_fea,
+            2 * offset + 1, axis=1)
+
+        # (B x T x K x 2L+1) @ (B x T x 2L+1 x D) -> (B x T x K x D)
+        weights = _batch_delta_weights(winlens, lengths, nframes)
+        np.matmul(weights.astype(out.dtype, copy=False),
+                  windows.swapaxes(-1, -2),
+                  out=out[:, :, dim:].reshape(nutts, nframes, -1, dim))
+
+    out[np.arange(nframes)[None, :] >= lengths[:, None]] = 0.
+    return out
+
+
+def stack_frames(fea, nframes, step=None, lengths=None):
+    '''Stack consecutive frames and subsample the result.
+
+    Frame i of the output is the concatenation of the frames
+    ``i * step, ..., i * step + nframes - 1`` of the input. With
+    ``step = nframes`` (the default) this divides the frame rate by
+    ``nframes``. The output is a strided view on the input: nothing is
+    copied until the result is consumed.
+
+    Args:
+        fea (numpy.ndarray or Tensor): Features matrix (T x D) or
+            padded batch of features (B x T x D).
+        nframes (int): Number of frames to stack.
+        step (int): Subsampling factor (default: ``nframes``).
+        lengths (numpy.ndarray): Number of valid frames of each
+            utterance of a padded batch.
+
+    Returns:
+        numpy.ndarray or Tensor: Stacked features
+            ((T - nframes) // step + 1 x nframes * D) or, for a batch,
+            (B x (T - nframes) // step + 1 x nframes * D).
+        numpy.ndarray: Number of valid stacked frames of each utterance
+            (only if ``lengths`` is given).
+
+    '''
+    step = step or nframes
+    is_tensor = torch.is_tensor(fea)
+    if not is_tensor:
+        fea = np.ascontiguousarray(fea)
+    elif not fea.is_contiguous():
+        fea = fea.contiguous()
+    *batch, total, dim = fea.shape
+    nout = max((total - nframes) // step + 1, 0)
+    shape = (*batch, nout, nframes * dim)
+
+    if is_tensor:
+        strides = (*fea.stride()[:-2], step * dim, 1)
+        retval = torch.as_strided(fea, shape, strides, fea.storage_offset())
+    else:
+        isize = fea.dtype.itemsize
+        strides = (*fea.strides[:-2], step * dim * isize, isize)
+        retval = np.lib.stride_tricks.as_strided(fea, shape, strides,
+                                                 writeable=False)
+
+    if lengths is not None:
+        lengths = np.maximum((np.asarray(lengths) - nframes) // step + 1, 0)
+        return retval, lengths
+    return retval
+
+
+class _DeltaFilter:
+    '''Streaming version of one derivative order of :func:`add_deltas`.
+
+    The last ``2 * wlen + 1`` input frames are kept in a preallocated
+    ring buffer. Each frame is written twice (at ``i`` and
+    ``i + 2 * wlen + 1``) so that the window of an output frame is
+    always a contiguous slice of the buffer.
+
+    '''
+
+    def __init__(self, wlen, dim):
+        self.wlen = wlen
+        self.weights = np.arange(-wlen, wlen + 1)
+        self.weights = self.weights / (2 * self.weights.dot(self.weights))
+        self._buffer = np.empty((2 * len(self.weights), dim))
+        self._out = np.empty(dim)
+        self._npushed = 0
+
+    def _push(self, frame):
+        size = len(self.weights)
+        pos = self._npushed % size
+        self._buffer[pos] = frame
+        self._buffer[pos + size] = frame
+        self._npushed += 1
+        if self._npushed < size:
+            return None
+        return np.dot(self.weights, self._buffer[pos + 1:pos + 1 + size],
+                      out=self._out)
+
+    def __call__(self, frame):
+        '''Add an input frame and return the next output frame (None
+        if not available yet). The output is only valid until the next
+        call.'''
+        if self._npushed == 0:
+            # Replicate the first frame.
+            for _ in range(self.wlen):
+                self._push(frame)
+        return self._push(frame)
+
+    def flush(self):
+        'Generate the remaining output frames.'
+        if self._npushed == 0:
+            return
+        # Replicate the last frame.
+        last = self._buffer[(self._npushed - 1) % len(self.weights)].copy()
+        for _ in range(self.wlen):
+            out = self._push(last)
+            if out is not None:
+                yield out
+
+
+class OnlineDeltas:
+    '''Add derivatives to features arriving frame by frame.
+
+    This is the streaming counterpart of :func:`add_deltas`: the
+    concatenation of the outputs is the same as calling
+    :func:`add_deltas` on the whole features matrix. The output for a
+    frame is available once ``latency = sum(winlens)`` frames after it
+    have been received (or when the stream is flushed). All the
+    buffers are allocated at the first call: only the returned
+    features are allocated afterwards.
+
+    Example:
+        >>> deltas = OnlineDeltas(winlens=(2, 2))
+        >>> for fea in fbank_stream(chunks):
+        ...     process(deltas(fea))
+        >>> process(deltas.flush())
+
+    '''
+
+    def __init__(self, winlens=(2,2)):
+        '''Initialize the computation of the derivatives.
+
+        Args:
+            winlens: tuple with window lengths for deltas, double
+                deltas, ... default is (2,2)
+
+        '''
+        self.winlens = winlens
+        self.latency = sum(winlens)
+        self._filters = None
+        self._dim = None
+
+        # Ring buffer of the frames waiting for their last derivative
+        # order and number of frames received for each order.
+        self._rows = None
+        self._counts = None
+        self._nin = 0
+        self._retval = None
+        self._first_out = 0
+
+    def _feed(self, order, frame):
+        # Add a frame of the given derivative order and propagate it
+        # to the next orders.
+        time = self._counts[order]
+        self._counts[order] += 1
+        row = self._rows[time % len(self._rows)]
+        row[order * self._dim:(order + 1) * self._dim] = frame
+        if order == len(self._filters):
+            self._retval[time - self._first_out] = row
+            return
+        out = self._filters[order](frame)
+        if out is not None:
+            self._feed(order + 1, out)
+
+    def __call__(self, fea, last=False):
+        '''Process new frames.
+
+        Args:
+            fea (numpy.ndarray): New features frames.
+            last (boolean): If True, the stream is over and all the
+                remaining frames are returned.
+
+        Returns:
+            numpy.ndarray: Features augmented with derivatives of the
+                frames completed by the call (possibly none).
+
+        '''
+        fea = np.asarray(fea)
+        if self._dim is None:
+            self._dim = fea.shape[1]
+            self._filters = [_DeltaFilter(wlen, self._dim)
+                             for wlen in self.winlens]
+            self._rows = np.empty((self.latency + 1,
+                                   self._dim * (len(self._filters) + 1)))
+            self._counts = [0] * (len(self._filters) + 1)
+
+        self._nin += len(fea)
+        nout = self._nin if last else max(self._nin - self.latency, 0)
+        self._first_out = self._counts[-1]
+        self._retval = np.empty((nout - self._first_out, self._rows.shape[1]),
+                                dtype=compute_dtype(numpy=True))
+        for frame in fea:
+            self._feed(0, frame)
+        if last:
+            # Each derivative order is computed from the previous one.
+            for order, delta_filter in enumerate(self._filters):
+                for out in delta_filter.flush():
+                    self._feed(order + 1, out)
+        retval, self._retval = self._retval, None
+        return retval
+
+    def flush(self):
+        'End the stream and return the remaining frames.'
+        if self._dim is None:
+            return np.zeros((0, 0))
+        return self(np.zeros((0, self._dim)), last=True)
 
 
 def fbank(signal, flen=0.025, frate=0.01, hifreq=8000, hz2scale=hz2mel,
           lowfreq=20, nfilters=26, preemph=0.97, scale2hz=mel2hz, srate=16000,
-          window=np.hamming):
+          window=np.hamming, prev_sample=None):
     '''Extract the FBANK features.
 
     The features are extracted according to the following scheme:
@@ -123,6 +443,10 @@ def fbank(signal, flen=0.025, frate=0.01, hifreq=8000, hz2scale=hz2mel,
         scale2hz (function): 'scale' -> Hz conversion.
         srate (int): Expected sampling rate.
         window (function): Windowing function.
+        prev_sample (float): Sample preceding the signal (when
+            extracting the features of a segment of a longer
+            recording). By default, the first sample is used as its
+            own predecessor for the pre-emphasis.
 
     '''
     # Convert the frame rate/length from second to number of samples.
@@ -133,24 +457,672 @@ def fbank(signal, flen=0.025, frate=0.01, hifreq=8000, hz2scale=hz2mel,
     nframes = (len(signal) - flen_samp) // frate_samp + 1
 
     # Pre-emphasis filtering.
-    s_t = np.array(signal, dtype=np.float32)
-    s_t -= preemph * np.r_[s_t[0], s_t[:-1]]
+    s_t = _preemphasis(signal, preemph, prev_sample)
 
     # Extract the overlapping frames.
+    sframes = _frames(s_t, nframes, flen_samp, frate_samp)
+
+    fft_len = _fft_len(flen_samp)
+    filters = create_fbank(nfilters, fft_len, srate=srate, lowfreq=lowfreq,
+                           highfreq=hifreq, hz2scale=hz2scale,
+                           scale2hz=scale2hz)
+    return _frames_to_fbank(sframes, window(flen_samp), fft_len, filters)
+
+
+def _preemphasis(signal, preemph, prev_sample=None):
+    '''Pre-emphasis filtering (the first sample is its own predecessor
+    unless ``prev_sample`` is given).'''
+    s_t = np.array(signal, dtype=compute_dtype(numpy=True))
+    prev_sample = s_t[0] if prev_sample is None else s_t.dtype.type(prev_sample)
+    s_t -= preemph * np.r_[prev_sample, s_t[:-1]]
+    return s_t
+
+
+def _fft_len(flen_samp):
+    'Smallest power of 2 strictly greater than the frame length.'
+    return int(2 ** np.floor(np.log2(flen_samp) + 1))
+
+
+def _frames(s_t, nframes, flen_samp, frate_samp):
+    'Read-only view of the overlapping frames of a signal.'
     isize = s_t.dtype.itemsize
-    sframes = np.lib.stride_tricks.as_strided(s_t, shape=(nframes, flen_samp),
+    return np.lib.stride_tricks.as_strided(s_t, shape=(nframes, flen_samp),
         strides=(frate_samp * isize, isize), writeable=False)
 
+
+def _magspec(sframes, window, fft_len):
+    'Window -> |FFT| for a matrix of frames.'
     # Apply the window function.
-    frames = sframes * np.hamming(flen_samp)[None, :]
+    frames = sframes * window[None, :].astype(sframes.dtype, copy=False)
+
+    # Compute FFT (scipy keeps the single precision).
+    return np.abs(scipy.fft.rfft(frames, n=fft_len, axis=-1)[:, :-1])
+
+
+def _filter_log(magspec, filters):
+    'Filter -> log for a magnitude spectrum.'
+    # Filtering (dense BLAS product, the frames are contiguous rows).
+    melspec = magspec @ filters.T.astype(magspec.dtype, copy=False)
+
+    return np.log(melspec + 1e-30)
+
+
+def _frames_to_fbank(sframes, window, fft_len, filters):
+    'Window -> |FFT| -> Filter -> log for a matrix of frames.'
+    return _filter_log(_magspec(sframes, window, fft_len), filters)
+
+
+def audio_chunks(fileobj, chunk_size=16000, dtype=np.int16):
+    '''Read a raw PCM stream chunk by chunk.
+
+    Args:
+        fileobj (file-like): Binary stream (opened file, pipe, socket,
+            ...) with a ``read`` method.
+        chunk_size (int): Number of samples per chunk.
+        dtype (numpy.dtype): Encoding of the samples.
+
+    Yields:
+        numpy.ndarray: Chunks of at most ``chunk_size`` samples.
+
+    '''
+    isize = np.dtype(dtype).itemsize
+    remainder = b''
+    while True:
+        data = fileobj.read(chunk_size * isize)
+        if not data:
+            break
+        data = remainder + data
+        nbytes = len(data) - len(data) % isize
+        data, remainder = data[:nbytes], data[nbytes:]
+        if nbytes > 0:
+            yield np.frombuffer(data, dtype=dtype)
+
+
+class OnlineFbank:
+    '''FBANK features extraction from audio chunks pushed one at a
+    time.
+
+    The pre-emphasis state and the samples of the frames overlapping
+    two chunks are carried over from one chunk to the next so that
+    the concatenation of the outputs is the same as calling
+    :func:`fbank` on the whole signal. Only the current chunk and
+    less than one frame of past samples are kept in memory.
+
+    Example:
+        >>> extractor = OnlineFbank(nfilters=30)
+        >>> for chunk in chunks:
+        ...     process(extractor(chunk))
+
+    '''
+
+    def __init__(self, flen=0.025, frate=0.01, hifreq=8000, hz2scale=hz2mel,
+                 lowfreq=20, nfilters=26, preemph=0.97, scale2hz=mel2hz,
+                 srate=16000, window=np.hamming):
+        '''Initialize the extractor (see :func:`fbank` for the
+        arguments).'''
+        self.frate_samp = int(srate * frate)
+        self.flen_samp = int(srate * flen)
+        self.fft_len = _fft_len(self.flen_samp)
+        self.nfilters = nfilters
+        self.preemph = preemph
+        self.window = window(self.flen_samp)
+        self.filters = create_fbank(nfilters, self.fft_len, srate=srate,
+            lowfreq=lowfreq, highfreq=hifreq, hz2scale=hz2scale,
+            scale2hz=scale2hz)
+
+        # Pre-emphasized samples not yet consumed by a frame and last
+        # raw sample of the previous chunk.
+        self._buffer = np.zeros(0, dtype=compute_dtype(numpy=True))
+        self._last_sample = None
+
+    def __call__(self, chunk):
+        '''Process a new chunk of audio.
+
+        Args:
+            chunk (numpy.ndarray): New audio samples.
+
+        Returns:
+            numpy.ndarray: FBANK features of the frames completed by
+                the chunk (possibly none).
+
+        '''
+        s_t = np.array(chunk, dtype=self._buffer.dtype)
+        if len(s_t) == 0:
+            return np.zeros((0, self.nfilters), dtype=s_t.dtype)
+
+        # Pre-emphasis filtering.
+        prev_sample = s_t[0] if self._last_sample is None else self._last_sample
+        self._last_sample = s_t[-1]
+        s_t -= self.preemph * np.r_[prev_sample, s_t[:-1]]
+
+        self._buffer = np.r_[self._buffer, s_t]
+        nframes = (len(self._buffer) - self.flen_samp) // self.frate_samp + 1
+        if nframes <= 0:
+            return np.zeros((0, self.nfilters), dtype=s_t.dtype)
+        sframes = _frames(self._buffer, nframes, self.flen_samp,
+                          self.frate_samp)
+        fea = _frames_to_fbank(sframes, self.window, self.fft_len,
+                               self.filters)
+        self._buffer = self._buffer[nframes * self.frate_samp:]
+        return fea
+
+
+def fbank_stream(chunks, chunk_size=16000, dtype=np.int16, **fea_args):
+    '''Extract the FBANK features from a stream of audio.
+
+    The concatenation of the outputs is the same as calling
+    :func:`fbank` on the whole signal (see :class:`OnlineFbank`).
+
+    Args:
+        chunks (iterable): Sequence of audio chunks (1D arrays) or a
+            binary file-like object of raw PCM (see
+            :func:`audio_chunks`).
+        chunk_size (int): Number of samples read at once from a
+            file-like object.
+        dtype (numpy.dtype): Encoding of the samples of a file-like
+            object.
+        fea_args (dict): See :func:`fbank` for the other arguments.
+
+    Yields:
+        numpy.ndarray: FBANK features of the frames completed by each
+            chunk.
+
+    '''
+    if hasattr(chunks, 'read'):
+        chunks = audio_chunks(chunks, chunk_size, dtype)
+    extractor = OnlineFbank(**fea_args)
+    for chunk in chunks:
+        fea = extractor(chunk)
+        if len(fea) > 0:
+            yield fea
+
+
+def fbank_multi(signal, configs, flen=0.025, frate=0.01, preemph=0.97,
+                srate=16000, window=np.hamming):
+    '''Extract several variants of the FBANK features with a single
+    FFT.
+
+    The magnitude spectrum is computed once and each configuration
+    only adds the filterbank product.
+
+    Example:
+        >>> feas = fbank_multi(signal, {
+        ...     'mel26': {'nfilters': 26},
+        ...     'mel40': {'nfilters': 40, 'lowfreq': 100},
+        ...     'bark': {'hz2scale': hz2bark, 'scale2hz': bark2hz}
+        ... })
+
+    Args:
+        signal (numpy.ndarray): The raw audio signal.
+        configs (dict): Filterbank configuration of each variant:
+            dictionary of arguments among ``nfilters``, ``lowfreq``,
+            ``hifreq``, ``hz2scale`` and ``scale2hz`` (see
+            :func:`fbank` for their default value).
+        ...: See :func:`fbank` for the other arguments.
+
+    Returns:
+        dict: FBANK features of each configuration.
+
+    '''
+    # Convert the frame rate/length from second to number of samples.
+    frate_samp = int(srate * frate)
+    flen_samp = int(srate * flen)
+    nframes = (len(signal) - flen_samp) // frate_samp + 1
+
+    s_t = _preemphasis(signal, preemph)
+    sframes = _frames(s_t, nframes, flen_samp, frate_samp)
+    fft_len = _fft_len(flen_samp)
+    magspec = _magspec(sframes, window(flen_samp), fft_len)
+
+    retval = {}
+    for name, config in configs.items():
+        config = {'nfilters': 26, 'lowfreq': 20, 'hifreq': 8000,
+                  'hz2scale': hz2mel, 'scale2hz': mel2hz, **config}
+        filters = create_fbank(config['nfilters'], fft_len, srate=srate,
+                               lowfreq=config['lowfreq'],
+                               highfreq=config['hifreq'],
+                               hz2scale=config['hz2scale'],
+                               scale2hz=config['scale2hz'])
+        retval[name] = _filter_log(magspec, filters)
+    return retval
+
+
+def fbank_batch(signals, flen=0.025, frate=0.01, hifreq=8000,
+                hz2scale=hz2mel, lowfreq=20, nfilters=26, preemph=0.97,
+                scale2hz=mel2hz, srate=16000, window=np.hamming,
+                packed=False, block_size=512):
+    '''Extract the FBANK features of several signals at once.
+
+    The signals are copied into a single buffer, each one starting on
+    a multiple of the frame rate, so that the frames of all the
+    signals lie on one regular grid of overlapping frames and the
+    pre-emphasis is computed in one call. The frames are then
+    windowed straight into a preallocated (``block_size`` x FFT
+    length) matrix and the FFT, the filtering and the log are
+    computed block by block. The number of python iterations does
+    not depend on the number of signals and the temporaries stay
+    small (see ``benchmarks/bench_fbank_batch.py`` for the gain over
+    calling :func:`fbank` in a loop).
+
+    Args:
+        signals (list): List of 1D raw audio signals.
+        packed (boolean): If True, return the features of all the
+            signals stacked in a single matrix along with the number
+            of frames of each signal.
+        block_size (int): Number of frames processed at once.
+        ...: See :func:`fbank` for the other arguments.
+
+    Returns:
+        list: FBANK features for each signal or, if ``packed=True``,
+            the stacked features (numpy.ndarray) and the number of
+            frames of each signal (numpy.ndarray).
+
+    '''
+    dtype = compute_dtype(numpy=True)
+    frate_samp = int(srate * frate)
+    flen_samp = int(srate * flen)
+    fft_len = _fft_len(flen_samp)
+    filters = create_fbank(nfilters, fft_len, srate=srate, lowfreq=lowfreq,
+                           highfreq=hifreq, hz2scale=hz2scale,
+                           scale2hz=scale2hz).T.astype(dtype)
+
+    sizes = np.array([len(signal) for signal in signals], dtype=np.int64)
+    lengths = np.maximum((sizes - flen_samp) // frate_samp + 1, 0)
+    nframes = int(lengths.sum())
+    fea = np.empty((nframes, nfilters), dtype=dtype)
+
+    if nframes > 0:
+        # Each signal starts on a multiple of the frame rate.
+        slots = -(-sizes // frate_samp) * frate_samp
+        offsets = np.cumsum(slots) - slots
+        raw = np.zeros(int(slots.sum()), dtype=dtype)
+        for offset, signal in zip(offsets, signals):
+            raw[offset:offset + len(signal)] = signal
+
+        # Pre-emphasis (the first sample of each signal is its own
+        # predecessor).
+        s_t = raw.copy()
+        s_t[1:] -= preemph * raw[:-1]
+        firsts = offsets[sizes > 0]
+        s_t[firsts] = raw[firsts] - preemph * raw[firsts]
+
+        # Row of each output frame in the grid of frames.
+        grid = _frames(s_t, (len(s_t) - flen_samp) // frate_samp + 1,
+                       flen_samp, frate_samp)
+        rows = np.repeat(offsets // frate_samp - (np.cumsum(lengths) - lengths),
+                         lengths) + np.arange(nframes)
+
+        # The columns after the frame length are never written so they
+        # remain zero and act as the FFT padding.
+        win = window(flen_samp).astype(dtype)
+        sframes = np.empty((min(block_size, nframes), flen_samp), dtype=dtype)
+        frames = np.zeros((len(sframes), fft_len), dtype=dtype)
+        for start in range(0, nframes, block_size):
+            block = frames[:min(block_size, nframes - start)]
+            np.take(grid, rows[start:start + len(block)], axis=0,
+                    out=sframes[:len(block)], mode='clip')
+            np.multiply(sframes[:len(block)], win, out=block[:, :flen_samp])
+            magspec = np.abs(scipy.fft.rfft(block, axis=-1)[:, :-1])
+            np.matmul(magspec, filters, out=fea[start:start + len(block)])
+        np.add(fea, 1e-30, out=fea)
+        np.log(fea, out=fea)
+
+    if packed:
+        return fea, lengths
+    return np.split(fea, np.cumsum(lengths)[:-1])
+
+
+class FbankExtractor:
+    '''FBANK features extractor with precomputed state.
+
+    The window, the filterbank and the FFT parameters are computed
+    once when creating the extractor and the computations are done
+    with a single floating point type. The scratch buffers and the
+    output buffer are kept from one call to the next and only grow
+    when a longer signal is processed. The only temporary allocated
+    at each call is the complex spectrum returned by
+    ``scipy.fft.rfft`` (nframes x FFT length / 2 + 1) which cannot
+    write into an existing buffer.
+
+    Example:
+        >>> extractor = FbankExtractor(nfilters=30, lowfreq=100)
+        >>> for signal in signals:
+        ...     fea = extractor(signal)
+
+    Note:
+        The returned features are a view on the output buffer of the
+        extractor and will be overwritten by the next call. Copy them
+        (or provide ``out``) if they need to be kept.
+
+    '''
+
+    def __init__(self, flen=0.025, frate=0.01, hifreq=8000, hz2scale=hz2mel,
+                 lowfreq=20, nfilters=26, preemph=0.97, scale2hz=mel2hz,
+                 srate=16000, window=np.hamming, dtype=None,
+                 workers=1):
+        '''Initialize the extractor.
+
+        Args:
+            dtype (numpy.dtype): Floating point type of the
+                computations and of the features (default: compute
+                type of :mod:`beer.precision`).
+            workers (int): Number of threads used to compute the FFT
+                (-1 for all the cores).
+            ...: See :func:`fbank` for the other arguments.
+
+        '''
+        self.dtype = compute_dtype(numpy=True) if dtype is None \
+            else np.dtype(dtype)
+        self.frate_samp = int(srate * frate)
+        self.flen_samp = int(srate * flen)
+        self.fft_len = _fft_len(self.flen_samp)
+        self.nfilters = nfilters
+        self.preemph = self.dtype.type(preemph)
+        self.window = window(self.flen_samp).astype(self.dtype)
+        self.filters = create_fbank(nfilters, self.fft_len, srate=srate,
+            lowfreq=lowfreq, highfreq=hifreq, hz2scale=hz2scale,
+            scale2hz=scale2hz).astype(self.dtype)
+        self._filters_t = np.ascontiguousarray(self.filters.T)
+        self.workers = workers
+
+        self._raw = np.zeros(0, dtype=self.dtype)
+        self._signal = np.zeros(0, dtype=self.dtype)
+        self._frames = np.zeros((0, self.fft_len), dtype=self.dtype)
+        self._magspec = np.zeros((0, self.fft_len // 2), dtype=self.dtype)
+        self._fea = np.zeros((0, nfilters), dtype=self.dtype)
+
+    def _grow(self, name, size):
+        'Return the first ``size`` rows of a buffer (reallocated if needed).'
+        buffer = getattr(self, name)
+        if len(buffer) < size:
+            buffer = np.zeros((size, *buffer.shape[1:]), dtype=self.dtype)
+            setattr(self, name, buffer)
+        return buffer[:size]
+
+    def nframes(self, nsamples):
+        'Number of frames for a signal of ``nsamples`` samples.'
+        return max((nsamples - self.flen_samp) // self.frate_samp + 1, 0)
+
+    def __call__(self, signal, out=None):
+        '''Extract the FBANK features.
+
+        Args:
+            signal (numpy.ndarray): The raw audio signal.
+            out (numpy.ndarray): Optional output matrix of shape
+                (number of frames x number of filters).
+
+        Returns:
+            numpy.ndarray: FBANK features.
+
+        '''
+        nframes = self.nframes(len(signal))
+        if out is None:
+            out = self._grow('_fea', nframes)
+
+        # Pre-emphasis filtering.
+        raw = self._grow('_raw', len(signal))
+        raw[:] = signal
+        s_t = self._grow('_signal', len(signal))
+        np.multiply(raw[:-1], self.preemph, out=s_t[1:])
+        np.subtract(raw[1:], s_t[1:], out=s_t[1:])
+        s_t[:1] = raw[:1] - self.preemph * raw[:1]
+
+        # Windowed frames. The columns after the frame length are never
+        # written so they remain zero and act as the FFT padding.
+        frames = self._grow('_frames', nframes)
+        np.multiply(_frames(s_t, nframes, self.flen_samp, self.frate_samp),
+                    self.window, out=frames[:, :self.flen_samp])
+
+        # Magnitude spectrum (the complex spectrum is allocated by
+        # scipy).
+        magspec = self._grow('_magspec', nframes)
+        np.abs(scipy.fft.rfft(frames, axis=-1, workers=self.workers)[:, :-1],
+               out=magspec)
+
+        # Filtering and log.
+        np.matmul(magspec, self._filters_t, out=out)
+        np.add(out, 1e-30, out=out)
+        return np.log(out, out=out)
+
+
+def fbank_torch(signal, flen=0.025, frate=0.01, hifreq=8000, hz2scale=hz2mel,
+                lowfreq=20, nfilters=26, preemph=0.97, scale2hz=mel2hz,
+                srate=16000, window=np.hamming):
+    '''Extract the FBANK features with pytorch.
+
+    Same as :func:`fbank` but all the computations are done with
+    pytorch operations. The input can be a batch of signals and the
+    output is differentiable w.r.t. the input signal.
+
+    Note:
+        For a batch of padded signals, the features of the frames
+        beyond the actual end of a signal are computed from the
+        padding. The number of valid frames for a signal of ``N``
+        samples is ``(N - flen * srate) // (frate * srate) + 1``.
+
+    Args:
+        signal (Tensor): The raw audio signal(s) as a (N) or (B x N)
+            tensor. Integer tensors are converted to the compute type
+            of :mod:`beer.precision`.
+        ...: See :func:`fbank` for the other arguments.
+
+    Returns:
+        Tensor: FBANK features as a (nframes x nfilters) or (B x nframes
+            x nfilters) tensor.
+
+    '''
+    signal = torch.as_tensor(signal)
+    if not signal.is_floating_point():
+        signal = signal.to(compute_dtype())
+
+    # Convert the frame rate/length from second to number of samples.
+    frate_samp = int(srate * frate)
+    flen_samp = int(srate * flen)
+    fft_len = _fft_len(flen_samp)
+
+    # Pre-emphasis filtering.
+    s_t = signal - preemph * torch.cat([signal[..., :1], signal[..., :-1]],
+                                       dim=-1)
+
+    # Extract the overlapping frames and apply the window function.
+    frames = s_t.unfold(-1, flen_samp, frate_samp)
+    frames = frames * torch.as_tensor(window(flen_samp), dtype=signal.dtype,
+                                      device=signal.device)
 
     # Compute FFT.
-    fft_len = int(2 ** np.floor(np.log2(flen_samp) + 1))
-    magspec = np.abs(np.fft.rfft(frames, n=fft_len, axis=-1)[:, :-1])
+    magspec = torch.fft.rfft(frames, n=fft_len, dim=-1)[..., :-1].abs()
 
     # Filtering.
-    filters = create_fbank(nfilters, fft_len, lowfreq=lowfreq, highfreq=hifreq)
-    melspec = magspec @ filters.T
+    filters = create_fbank(nfilters, fft_len, srate=srate, lowfreq=lowfreq,
+                           highfreq=hifreq, hz2scale=hz2scale,
+                           scale2hz=scale2hz)
+    filters = torch.as_tensor(filters, dtype=signal.dtype,
+                              device=signal.device)
+    melspec = magspec @ filters.t()
 
-    return np.log(melspec + 1e-30)
+    return torch.log(melspec + 1e-30)
+
+
+class MeanVarianceStats:
+    '''Running mean and variance of features.
+
+    The statistics are updated chunk by chunk with the numerically
+    stable pairwise update of Chan et al. and only O(D) memory is
+    used regardless of the number of frames. Statistics accumulated
+    separately (on different workers for instance) can be merged.
+
+    Example:
+        >>> stats = MeanVarianceStats()
+        >>> for fea in corpus:
+        ...     stats.update(fea)
+        >>> normalized_fea = stats.normalize(fea)
+
+    '''
+
+    def __init__(self, dim=None):
+        self.count = 0
+        self.mean = None if dim is None else \
+            np.zeros(dim, dtype=stats_dtype(numpy=True))
+        self._m2 = None if dim is None else \
+            np.zeros(dim, dtype=stats_dtype(numpy=True))
+
+    def _merge(self, count, mean, m2):
+        if count == 0:
+            return
+        if self.count == 0:
+            self.count, self.mean, self._m2 = count, mean.copy(), m2.copy()
+            return
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean = self.mean + delta * (count / total)
+        self._m2 = self._m2 + m2 + delta ** 2 * (self.count * count / total)
+        self.count = total
+
+    def update(self, fea):
+        '''Accumulate the statistics of new frames.
+
+        Args:
+            fea (numpy.ndarray): Features matrix.
+
+        Returns:
+            ``MeanVarianceStats``: The updated statistics.
+
+        '''
+        fea = np.asarray(fea, dtype=stats_dtype(numpy=True))
+        if len(fea) > 0:
+            mean = fea.mean(axis=0)
+            self._merge(len(fea), mean, ((fea - mean) ** 2).sum(axis=0))
+        return self
+
+    def merge(self, other):
+        '''Merge the statistics accumulated by another object.
+
+        Args:
+            other (``MeanVarianceStats``): Statistics to merge.
+
+        Returns:
+            ``MeanVarianceStats``: The updated statistics.
+
+        '''
+        self._merge(other.count, other.mean, other._m2)
+        return self
+
+    @property
+    def var(self):
+        'Variance of the features.'
+        return self._m2 / self.count
+
+    @property
+    def std(self):
+        'Standard deviation of the features.'
+        return np.sqrt(self.var)
+
+    def normalize(self, fea, inplace=False, floor=1e-10):
+        '''Normalize features to zero mean and unit variance.
+
+        Args:
+            fea (numpy.ndarray): Features matrix.
+            inplace (boolean): Overwrite ``fea`` with the result.
+            floor (float): Variance floor.
+
+        Returns:
+            numpy.ndarray: Normalized features.
+
+        '''
+        scale = 1. / np.sqrt(np.maximum(self.var, floor))
+        if inplace:
+            fea -= self.mean.astype(fea.dtype)
+            fea *= scale.astype(fea.dtype)
+            return fea
+        return ((fea - self.mean) * scale).astype(compute_dtype(numpy=True))
+
+    def normalize_stream(self, feas, inplace=False, floor=1e-10):
+        '''Normalize a sequence of features matrices.
+
+        Args:
+            feas (iterable): Features matrices.
+            inplace (boolean): Overwrite the matrices with the result.
+            floor (float): Variance floor.
+
+        Yields:
+            numpy.ndarray: Normalized features.
+
+        '''
+        for fea in feas:
+            yield self.normalize(fea, inplace=inplace, floor=floor)
+
+
+def frame_log_energy(signal, flen=0.025, frate=0.01, srate=16000):
+    '''Log energy of each frame of the signal.
+
+    The frames are the same as the ones of :func:`fbank` (before
+    pre-emphasis and windowing) and are not copied.
+
+    Args:
+        signal (numpy.ndarray): The raw audio signal.
+        flen (float): Frame length in seconds.
+        frate (float): Frame rate in seconds.
+        srate (int): Sampling rate of the signal.
+
+    Returns:
+        numpy.ndarray: Log energy of each frame.
+
+    '''
+    frate_samp = int(srate * frate)
+    flen_samp = int(srate * flen)
+    nframes = max((len(signal) - flen_samp) // frate_samp + 1, 0)
+    s_t = np.asarray(signal, dtype=compute_dtype(numpy=True))
+    sframes = _frames(s_t, nframes, flen_samp, frate_samp)
+    return np.log(np.einsum('ij,ij->i', sframes, sframes) + 1e-30)
+
+
+def select_frames(log_energy, threshold=-7., relative=True, hangover=5,
+                  min_duration=3, return_indices=False):
+    '''Energy based selection of the speech frames.
+
+    A frame is selected if its log energy is above the threshold.
+    Segments of selected frames shorter than ``min_duration`` are
+    discarded and the remaining segments are extended by ``hangover``
+    frames on each side so that the beginning and the end of the
+    words are not cut.
+
+    Args:
+        log_energy (numpy.ndarray): Log energy of each frame (see
+            :func:`frame_log_energy`).
+        threshold (float): Threshold on the (natural) log energy.
+        relative (boolean): If True, the threshold is relative to the
+            maximum log energy of the utterance (the default -7 is
+            about 30 dB below the loudest frame).
+        hangover (int): Number of frames added before and after each
+            speech segment.
+        min_duration (int): Minimum number of consecutive frames above
+            the threshold to form a speech segment.
+        return_indices (boolean): Return the indices of the selected
+            frames instead of a mask.
+
+    Returns:
+        numpy.ndarray: Boolean mask (or indices) of the speech frames.
+
+    '''
+    log_energy = np.asarray(log_energy)
+    if len(log_energy) == 0:
+        mask = np.zeros(0, dtype=bool)
+        return np.flatnonzero(mask) if return_indices else mask
+    if relative:
+        threshold = log_energy.max() + threshold
+    mask = log_energy > threshold
+
+    # Remove the short segments.
+    if min_duration > 1:
+        edges = np.diff(np.r_[0, mask.astype(np.int8), 0])
+        starts, ends = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+        for start, end in zip(starts, ends):
+            if end - start < min_duration:
+                mask[start:end] = False
+
+    # Hangover.
+    if hangover > 0:
+        mask = np.convolve(mask, np.ones(2 * hangover + 1),
+                           mode='full')[hangover:hangover + len(mask)] > 0
 
+    return np.flatnonzero(mask) if return_indices else mask
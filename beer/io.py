@@ -0,0 +1,499 @@
+'''Storage of the features of a corpus.
+
+A feature archive is made of two files:
+  * ``<path>.fea``: the raw data of all the utterances one after
+    another,
+  * ``<path>.idx``: a text index with one line per utterance:
+    ``<uttid> <offset> <dtype> <nrows> <ncols> [quantized]`` where
+    ``offset`` is in bytes from the beginning of the data file.
+
+The data file is memory-mapped when reading the archive so that
+loading an utterance does not copy anything.
+
+To reduce the size of the archive, the features can be quantized
+(int16 or uint8) with a scale and an offset per column of each
+utterance. The data of a quantized utterance is then preceded by a
+(2 x ncols) float32 matrix holding the offsets and the scales, and
+the features are dequantized to float32 when read.
+
+The module also provides an on-disk cache of extracted features
+(:class:`FeatureCache`) and a reader of audio segments
+(:func:`read_segment`).
+
+'''
+
+
+import hashlib
+import inspect
+import os
+import numpy as np
+import scipy.io.wavfile
+import torch
+
+from . import features
+from .precision import compute_dtype
+
+
+class FeatureArchiveWriter:
+    '''Write features matrices to an archive.
+
+    Example:
+        >>> with FeatureArchiveWriter('feats') as archive:
+        ...     archive.write('utt1', fea1)
+        ...     archive.write('utt2', fea2)
+
+    '''
+
+    def __init__(self, path, quantize=None, per_column=True):
+        '''Create the archive.
+
+        Args:
+            path (string): Path of the archive (without extension).
+            quantize (numpy.dtype): Quantize the features to this
+                integer type (``numpy.int16`` or ``numpy.uint8``).
+                None to store the features as they are.
+            per_column (boolean): When quantizing, use a different
+                scale and offset for each column (otherwise one for
+                the whole utterance).
+
+        '''
+        self.path = path
+        self.quantize = None if quantize is None else np.dtype(quantize)
+        self.per_column = per_column
+        self.max_error = 0.
+        self._data = open(path + '.fea', 'wb')
+        self._index = []
+        self._uttids = set()
+        self._offset = 0
+
+    def _write_bytes(self, data, alignment):
+        # Align the data on the size of its elements.
+        padding = -self._offset % alignment
+        self._data.write(b'\0' * padding)
+        self._offset += padding
+        offset = self._offset
+        self._data.write(data)
+        self._offset += len(data)
+        return offset
+
+    def _quantize(self, fea):
+        fea = fea.astype(np.float32)
+        info = np.iinfo(self.quantize)
+        if self.per_column:
+            fmin, fmax = fea.min(axis=0), fea.max(axis=0)
+        else:
+            fmin = np.full(fea.shape[1], fea.min(), dtype=np.float32)
+            fmax = np.full(fea.shape[1], fea.max(), dtype=np.float32)
+        scale = ((fmax - fmin) / (float(info.max) - float(info.min)))
+        scale = np.where(scale > 0, scale, 1.).astype(np.float32)
+        offset = (fmin - info.min * scale).astype(np.float32)
+        qfea = np.clip(np.round((fea - offset) / scale), info.min, info.max)
+        qfea = qfea.astype(self.quantize)
+        error = np.abs(qfea * scale + offset - fea).max()
+        return np.stack([offset, scale]), qfea, float(error)
+
+    def write(self, uttid, fea):
+        '''Append the features of an utterance to the archive.
+
+        Args:
+            uttid (string): Utterance id (without white spaces).
+            fea (numpy.ndarray): Features matrix (2D).
+
+        Returns:
+            float: Maximum absolute reconstruction error due to the
+                quantization (0 if the features are not quantized).
+
+        '''
+        if uttid in self._uttids:
+            raise ValueError('Duplicate utterance id: {}'.format(uttid))
+        if len(uttid.split()) != 1:
+            raise ValueError('Invalid utterance id: "{}"'.format(uttid))
+        fea = np.ascontiguousarray(fea)
+        if len(fea.shape) != 2:
+            raise ValueError('Expect a 2D array')
+
+        error = 0.
+        if self.quantize is None or fea.size == 0:
+            offset = self._write_bytes(fea.tobytes(), fea.dtype.itemsize)
+            self._index.append((uttid, offset, fea.dtype.str, *fea.shape))
+        else:
+            params, qfea, error = self._quantize(fea)
+            offset = self._write_bytes(params.tobytes() + qfea.tobytes(),
+                                       params.dtype.itemsize)
+            self._index.append((uttid, offset, qfea.dtype.str, *fea.shape,
+                                'quantized'))
+            self.max_error = max(self.max_error, error)
+        self._uttids.add(uttid)
+        return error
+
+    def close(self):
+        'Write the index and close the archive.'
+        self._data.close()
+        with open(self.path + '.idx', 'w') as fid:
+            for entry in self._index:
+                print(*entry, file=fid)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def write_archive(path, items, quantize=None, per_column=True):
+    '''Write an archive from a sequence of features.
+
+    Args:
+        path (string): Path of the archive (without extension).
+        items (iterable): Sequence of (uttid, features) pairs.
+        quantize (numpy.dtype): See :class:`FeatureArchiveWriter`.
+        per_column (boolean): See :class:`FeatureArchiveWriter`.
+
+    Returns:
+        float: Maximum absolute reconstruction error due to the
+            quantization.
+
+    '''
+    with FeatureArchiveWriter(path, quantize, per_column) as archive:
+        for uttid, fea in items:
+            archive.write(uttid, fea)
+    return archive.max_error
+
+
+class FeatureArchive:
+    '''Read-only access to a features archive.
+
+    The data file is memory-mapped and the features of an utterance
+    are returned as a view on the mapping: accessing an utterance is
+    O(1) and the data is loaded from disk by the OS only when it is
+    read. The views are copy-on-write: modifying them does not alter
+    the archive.
+
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self._entries = {}
+        with open(path + '.idx', 'r') as fid:
+            for line in fid:
+                uttid, offset, dtype, nrows, ncols, *quantized = line.split()
+                self._entries[uttid] = (int(offset), np.dtype(dtype),
+                                        (int(nrows), int(ncols)),
+                                        bool(quantized))
+        # An empty file (no entry or zero-frame entries only) cannot be
+        # memory-mapped.
+        if os.path.getsize(path + '.fea') > 0:
+            self._mmap = np.memmap(path + '.fea', dtype=np.uint8, mode='c')
+        else:
+            self._mmap = np.zeros(0, dtype=np.uint8)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, uttid):
+        return uttid in self._entries
+
+    def __iter__(self):
+        return iter(self._entries)
+
+    def keys(self):
+        'Utterance ids in the order they were written.'
+        return self._entries.keys()
+
+    def items(self):
+        'Iterate over the (uttid, features) pairs.'
+        for uttid in self._entries:
+            yield uttid, self[uttid]
+
+    def raw(self, uttid):
+        '''Stored data of an utterance (no copy).
+
+        Returns:
+            numpy.ndarray: The features or, for quantized features,
+                the quantized values.
+            numpy.ndarray: (2 x ncols) offsets and scales of the
+                quantization (None if not quantized).
+
+        '''
+        offset, dtype, shape, quantized = self._entries[uttid]
+        params = None
+        if quantized:
+            params = np.ndarray((2, shape[1]), dtype=np.float32,
+                                buffer=self._mmap, offset=offset)
+            offset += params.nbytes
+        return np.ndarray(shape, dtype=dtype, buffer=self._mmap,
+                          offset=offset), params
+
+    def __getitem__(self, uttid):
+        data, params = self.raw(uttid)
+        if params is None:
+            return data
+        return data * params[1] + params[0]
+
+    def chunks(self, uttid, chunk_size=1000):
+        '''Iterate over the features of an utterance by chunks of
+        frames. Quantized features are dequantized one chunk at a time.
+
+        Args:
+            uttid (string): Utterance id.
+            chunk_size (int): Number of frames per chunk.
+
+        Yields:
+            numpy.ndarray: Features of the next ``chunk_size`` frames.
+
+        '''
+        data, params = self.raw(uttid)
+        for start in range(0, len(data), chunk_size):
+            chunk = data[start:start + chunk_size]
+            yield chunk if params is None else chunk * params[1] + params[0]
+
+    def tensor(self, uttid):
+        '''Features of an utterance as a torch tensor sharing the
+        memory of the mapping (except for quantized features).
+
+        '''
+        return torch.from_numpy(self[uttid])
+
+    def frames(self):
+        '''All the frames of the archive as a single matrix (no copy)
+        along with the index of the first frame of each utterance.
+
+        This requires the utterances to have the same dimension and
+        data type and not to be quantized.
+
+        Returns:
+            numpy.ndarray: (total number of frames x dimension) matrix.
+            dict: Index of the first frame of each utterance.
+
+        '''
+        entries = list(self._entries.items())
+        if not entries:
+            return np.zeros((0, 0)), {}
+        _, (start, dtype, (_, ncols), _) = entries[0]
+        rowsize = dtype.itemsize * ncols
+        first_frames = {}
+        nrows = 0
+        for uttid, (offset, e_dtype, (e_nrows, e_ncols), quantized) in entries:
+            if quantized:
+                raise ValueError('Quantized archive')
+            if e_dtype != dtype or e_ncols != ncols:
+                raise ValueError('Utterances have different dimension or type')
+            if offset != start + nrows * rowsize:
+                raise ValueError('Utterances are not contiguous')
+            first_frames[uttid] = nrows
+            nrows += e_nrows
+        return np.ndarray((nrows, ncols), dtype=dtype, buffer=self._mmap,
+                          offset=start), first_frames
+
+
+def _param_repr(value):
+    'Stable representation of an extraction parameter.'
+    if callable(value):
+        return '{}.{}'.format(value.__module__, value.__qualname__)
+    return repr(value)
+
+
+class FeatureCache:
+    '''Content-addressed on-disk cache of extracted features.
+
+    The features are stored in ``<cachedir>/<key>.npy`` where the key
+    is a hash of the audio samples, of all the extraction parameters
+    (including the default ones) and of the compute type of the
+    precision policy (see :mod:`beer.precision`). When the total size of
+    the cache exceeds ``max_size`` the least recently used entries are
+    deleted. The cache can be shared by several processes.
+
+    The cache directory is not scanned at each store: the size of the
+    cache is estimated from the entries stored by the current process
+    and the directory is scanned only when the estimate exceeds
+    ``max_size`` or every ``scan_every`` stores (to account for the
+    entries stored by the other processes).
+
+    Note:
+        Functions (scale conversion, window) are identified by their
+        qualified name so lambda functions should be avoided.
+
+    Example:
+        >>> cache = FeatureCache('/tmp/fea_cache', max_size=2**30)
+        >>> fea = cache.extract(signal, winlens=(2, 2), nfilters=30)
+
+    '''
+
+    def __init__(self, cachedir, max_size=2**32, scan_every=1000):
+        '''Initialize the cache.
+
+        Args:
+            cachedir (string): Directory of the cache (created if
+                needed).
+            max_size (int): Maximum size of the cache in bytes.
+            scan_every (int): Number of stores between two scans of
+                the cache directory.
+
+        '''
+        self.cachedir = cachedir
+        self.max_size = max_size
+        self.scan_every = scan_every
+        os.makedirs(cachedir, exist_ok=True)
+
+        # Estimated size of the cache (None if unknown) and number of
+        # stores since the last scan of the directory.
+        self._size = None
+        self._nstores = 0
+
+    def key(self, signal, winlens=None, **fea_args):
+        '''Key of the features of a signal.
+
+        Args:
+            signal (numpy.ndarray): The raw audio signal.
+            winlens (tuple): Window lengths of the derivatives (None
+                for no derivatives).
+            fea_args (dict): Arguments for :func:`beer.features.fbank`.
+
+        Returns:
+            string: Hexadecimal digest.
+
+        '''
+        signal = np.ascontiguousarray(signal)
+        args = inspect.signature(features.fbank).bind(signal, **fea_args)
+        args.apply_defaults()
+        digest = hashlib.sha1()
+        digest.update(signal.dtype.str.encode())
+        digest.update(signal.tobytes())
+        for name, value in sorted(args.arguments.items()):
+            if name != 'signal':
+                digest.update('{}={};'.format(name, _param_repr(value)).encode())
+        digest.update('winlens={};'.format(_param_repr(winlens)).encode())
+        digest.update('dtype={};'.format(
+            compute_dtype(numpy=True).str).encode())
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cachedir, key + '.npy')
+
+    def load(self, key):
+        'Load the features for ``key`` (None if not in the cache).'
+        path = self._path(key)
+        try:
+            fea = np.load(path)
+        except (FileNotFoundError, ValueError, OSError):
+            return None
+        # Mark the entry as recently used.
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        return fea
+
+    def store(self, key, fea):
+        'Store the features for ``key`` and evict old entries if needed.'
+        tmp_path = '{}.{}.tmp'.format(self._path(key), os.getpid())
+        with open(tmp_path, 'wb') as fid:
+            np.save(fid, fea)
+            nbytes = fid.tell()
+        os.replace(tmp_path, self._path(key))
+        self._nstores += 1
+        if self._size is not None:
+            self._size += nbytes
+        if self._size is None or self._size > self.max_size \
+                or self._nstores >= self.scan_every:
+            self._evict()
+
+    def _evict(self):
+        entries = []
+        for entry in os.scandir(self.cachedir):
+            if entry.name.endswith('.npy'):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total_size -= size
+        self._size, self._nstores = total_size, 0
+
+    def extract(self, signal, winlens=None, **fea_args):
+        '''Extract the FBANK features (and their derivatives) of a
+        signal or load them from the cache.
+
+        Args:
+            signal (numpy.ndarray): The raw audio signal.
+            winlens (tuple): Window lengths of the derivatives (None
+                for no derivatives).
+            fea_args (dict): Arguments for :func:`beer.features.fbank`.
+
+        Returns:
+            numpy.ndarray: The features.
+
+        '''
+        key = self.key(signal, winlens, **fea_args)
+        fea = self.load(key)
+        if fea is None:
+            fea = features.fbank(signal, **fea_args)
+            if winlens:
+                fea = features.add_deltas(fea, winlens)
+            self.store(key, fea)
+        return fea
+
+
+def read_segment(path, start=0., end=None, flen=0.025, frate=0.01,
+                 srate=16000, dtype=np.int16, channel=0):
+    '''Read the samples of a segment of a WAV or raw PCM file.
+
+    The file is memory-mapped and only the samples needed to extract
+    the features of the segment are read. The returned samples start
+    with the first frame of the segment and end with its last frame so
+    that:
+
+        >>> signal, prev_sample = read_segment(path, start, end)
+        >>> fea = fbank(signal, prev_sample=prev_sample)
+
+    gives the same features as the frames of the segment extracted
+    from the whole recording.
+
+    Args:
+        path (string): Path to a WAV file or to a raw PCM file (any
+            other extension).
+        start (float): Start time of the segment in seconds.
+        end (float): End time of the segment in seconds (None for the
+            end of the recording).
+        flen (float): Frame length in seconds.
+        frate (float): Frame rate in seconds.
+        srate (int): Sampling rate of raw PCM files (the sampling rate
+            of WAV files is read from their header).
+        dtype (numpy.dtype): Encoding of the samples of raw PCM files.
+        channel (int): Channel to read for multi-channel WAV files.
+
+    Returns:
+        numpy.ndarray: Samples of the segment.
+        float: Sample preceding the segment (None if the segment
+            starts at the beginning of the recording), to be used as
+            pre-emphasis context.
+
+    '''
+    if path.lower().endswith('.wav'):
+        srate, data = scipy.io.wavfile.read(path, mmap=True)
+        if len(data.shape) == 2:
+            data = data[:, channel]
+    else:
+        data = np.memmap(path, dtype=dtype, mode='r')
+
+    frate_samp = int(srate * frate)
+    flen_samp = int(srate * flen)
+    nframes = max((len(data) - flen_samp) // frate_samp + 1, 0)
+    first_frame = min(int(round(start / frate)), nframes)
+    last_frame = nframes if end is None else \
+        min(int(round(end / frate)), nframes)
+    if last_frame <= first_frame:
+        return np.zeros(0, dtype=data.dtype), None
+
+    begin = first_frame * frate_samp
+    stop = (last_frame - 1) * frate_samp + flen_samp
+    prev_sample = data[begin - 1].item() if begin > 0 else None
+    return np.array(data[begin:stop]), prev_sample
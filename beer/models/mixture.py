@@ -1,12 +1,15 @@
 
 'Bayesian Mixture model.'
 
+import copy
 from itertools import chain
 from .model import ConjugateExponentialModel
-from ..expfamily import DirichletPrior, kl_div
+from .model import _select_frames
+from ..precision import compute_dtype, stats_dtype
+from ..expfamily import DirichletPrior, BatchExpFamilyDensity, kl_div
+from ..expfamily import pairwise_kl_div
 import math
 import torch
-import torch.autograd as ta
 
 
 
@@ -16,6 +19,12 @@ def _logsumexp(tensor):
     return s + (tensor - s).exp().sum(dim=1, keepdim=True).log()
 
 
+def _accumulate(resps, T):
+    'Per-component statistics accumulated with the statistics type.'
+    resps = resps.to(stats_dtype())
+    return resps.t() @ T.to(stats_dtype()), resps.sum(dim=0)
+
+
 class Mixture(ConjugateExponentialModel):
     'Bayesian Mixture Model.'
 
@@ -47,12 +56,25 @@ class Mixture(ConjugateExponentialModel):
         return Mixture(prior_weights, components, posterior_weights)
 
     def __init__(self, prior_weights, components, posterior_weights):
-        # This will be initialize in the _prepare() call.
-        self._np_params_matrix = None
         self.prior_weights = prior_weights
         self.components = components
         self.posterior_weights = posterior_weights
-        self._prepare()
+
+        # Priors/posteriors of the components stored as batches so
+        # they can be updated all at once. The components' prior and
+        # posterior become views on the batches.
+        self._priors = BatchExpFamilyDensity.from_densities(
+            [component.prior for component in components])
+        self._posteriors = BatchExpFamilyDensity.from_densities(
+            [component.posterior for component in components])
+        for component, prior, posterior in zip(components, self._priors,
+                                               self._posteriors):
+            component.prior, component.posterior = prior, posterior
+
+        # Cache of the matrix of expected natural parameters and the
+        # versions of the posteriors it was computed from.
+        self._np_params_cache = None
+        self._np_params_versions = None
 
     @property
     def weights(self):
@@ -74,11 +96,17 @@ class Mixture(ConjugateExponentialModel):
         return torch.cat([self.components[0].sufficient_statistics(X),
                      ones[:, None]], dim=-1)
 
-    def _prepare(self):
-        matrix = torch.cat([component.posterior.expected_sufficient_statistics[None]
-            for component in self.components], dim=0)
-        self._np_params_matrix = torch.cat([matrix,
-            self.posterior_weights.expected_sufficient_statistics[:, None]], dim=1)
+    @property
+    def _np_params_matrix(self):
+        versions = (self._posteriors.version, self.posterior_weights.version,
+                    compute_dtype())
+        if versions != self._np_params_versions:
+            matrix = self._posteriors.expected_sufficient_statistics
+            self._np_params_cache = torch.cat([matrix,
+                self.posterior_weights.expected_sufficient_statistics[:, None]],
+                dim=1).to(compute_dtype())
+            self._np_params_versions = versions
+        return self._np_params_cache
 
     def expected_natural_params(self, mean, var):
         # TODO: pytorch version
@@ -86,6 +114,7 @@ class Mixture(ConjugateExponentialModel):
         the sufficient statistics.
 
         '''
+        mean, var = mean.to(compute_dtype()), var.to(compute_dtype())
         T = self.components[0].sufficient_statistics_from_mean_var(mean, var)
         T2 = torch.cat([T, torch.ones(T.size(0), 1).type(mean.type())], dim=-1)
 
@@ -99,12 +128,12 @@ class Mixture(ConjugateExponentialModel):
             for component in self.components], dim=0)
 
         # Accumulate the sufficient statistics.
-        acc_stats = resps.t() @ T2[:, :-1], resps.sum(dim=0)
+        acc_stats = _accumulate(resps, T2[:, :-1])
 
         return (resps @ matrix), acc_stats
 
 
-    def exp_llh(self, X, accumulate=False):
+    def exp_llh(self, X, accumulate=False, mask=None):
         '''Expected value of the log-likelihood w.r.t to the posterior
         distribution over the parameters.
 
@@ -112,18 +141,33 @@ class Mixture(ConjugateExponentialModel):
             X (Tensor): Data as a matrix.
             accumulate (boolean): If True, returns the accumulated
                 statistics.
+            mask (numpy.ndarray): Boolean mask of the frames to
+                process. The other frames are ignored.
 
         Returns:
-            Tensor: Per-frame expected value of the log-likelihood.
+            Tensor: Per-frame expected value of the log-likelihood (of
+                the selected frames only if ``mask`` is given).
             tuple(Tensor, Tensor): Accumulated statistics
                 (if ``accumulate=True``).
 
         '''
-        T = self.sufficient_statistics(X)
+        X = _select_frames(X, mask).to(compute_dtype())
+        exp_llh, resps = self._exp_llh_resps(X)
+
+        if accumulate:
+            acc_stats = self.components[0]._accumulate(X, resps), \
+                resps.sum(dim=0, dtype=stats_dtype())
+            return exp_llh, acc_stats
+
+        return exp_llh
 
+    def _exp_llh_resps(self, X):
         # Note: the lognormalizer is already included in the expected
         # value of the natural parameters.
-        per_component_exp_llh = T @ self._np_params_matrix.t()
+        matrix = self._np_params_matrix
+        per_component_exp_llh = \
+            self.components[0]._exp_llh_matrix(X, matrix[:, :-1]) \
+            + matrix[:, -1]
 
         # Components' responsibilities.
         exp_llh = _logsumexp(per_component_exp_llh)
@@ -133,14 +177,24 @@ class Mixture(ConjugateExponentialModel):
         exp_llh -= .5 * X.size(1) * math.log(2 * math.pi)
 
         # Make sure it is a single dimension vector.
-        exp_llh = exp_llh.view(-1)
+        return exp_llh.view(-1), resps
 
+    def responsibilities(self, X, mask=None):
+        '''Expected value of the log-likelihood and responsibilities
+        of the components for each frame.
 
-        if accumulate:
-            acc_stats = resps.t() @ T[:, :-1], resps.sum(dim=0)
-            return exp_llh, acc_stats
+        Args:
+            X (Tensor): Data as a matrix.
+            mask (numpy.ndarray): Boolean mask of the frames to
+                process. The other frames are ignored.
 
-        return exp_llh
+        Returns:
+            Tensor: Per-frame expected value of the log-likelihood.
+            Tensor: Per-frame responsibilities of the components.
+
+        '''
+        X = _select_frames(X, mask).to(compute_dtype())
+        return self._exp_llh_resps(X)
 
     def kl_div_posterior_prior(self):
         '''KL divergence between the posterior and prior distribution.
@@ -149,10 +203,8 @@ class Mixture(ConjugateExponentialModel):
             float: KL divergence.
 
         '''
-        retval = kl_div(self.posterior_weights, self.prior_weights)
-        for component in self.components:
-            retval += kl_div(component.posterior, component.prior)
-        return retval
+        return kl_div(self.posterior_weights, self.prior_weights) \
+            + kl_div(self._posteriors, self._priors).sum()
 
     def natural_grad_update(self, acc_stats, scale, lrate):
         '''Perform a natural gradient update of the posteriors'
@@ -167,17 +219,16 @@ class Mixture(ConjugateExponentialModel):
         comp_stats, weights_stats = acc_stats
 
         # Update the components.
-        for i, component in enumerate(self.components):
-            component.natural_grad_update(comp_stats[i], scale, lrate)
+        natural_grad = self._priors.natural_params + scale * comp_stats \
+            - self._posteriors.natural_params
+        self._posteriors.natural_params = self._posteriors.natural_params \
+            + lrate * natural_grad
 
         # Update the weights.
         natural_grad = self.prior_weights.natural_params \
             + scale * weights_stats - self.posterior_weights.natural_params
-        self.posterior_weights.natural_params = ta.Variable(\
-            self.posterior_weights.natural_params + lrate * natural_grad,
-            requires_grad=True)
-
-        self._prepare()
+        self.posterior_weights.natural_params = \
+            self.posterior_weights.natural_params + lrate * natural_grad
 
     def split(self):
         '''Split each component into two sub-components.
@@ -202,3 +253,73 @@ class Mixture(ConjugateExponentialModel):
         return Mixture(new_prior_weights, new_components,
                        new_posterior_weights)
 
+    def merge(self, n_merges=None, max_div=float('inf')):
+        '''Merge the closest pairs of components.
+
+        The pairs are chosen greedily by increasing symmetrized KL
+        divergence between the components' posteriors (see
+        :func:`beer.pairwise_kl_div`) and each component is merged at
+        most once. The statistics of the two components of a pair are
+        added: the natural parameters of the merged posterior are the
+        sum of the natural parameters of the two posteriors minus their
+        (averaged) prior. The weights of the pair are added as well.
+
+        Args:
+            n_merges (int): Maximum number of pairs to merge (default:
+                as many as possible).
+            max_div (float): Do not merge pairs whose divergence is
+                greater than this value.
+
+        Returns:
+            ``Mixture``: A new mixture with ``n_merges`` (or less)
+                fewer components.
+
+        '''
+        n_components = len(self.components)
+        if n_merges is None:
+            n_merges = n_components // 2
+        n_merges = min(n_merges, n_components // 2)
+
+        # Divergence of each pair (i, j) with i < j in increasing order.
+        rows, cols = torch.triu_indices(n_components, n_components, 1)
+        kl_divs = pairwise_kl_div(self._posteriors)[rows, cols]
+        order = torch.argsort(kl_divs, stable=True)
+
+        pairs, merged = [], set()
+        for idx, div in zip(order.tolist(), kl_divs[order].tolist()):
+            if len(pairs) >= n_merges or div > max_div:
+                break
+            i, j = int(rows[idx]), int(cols[idx])
+            if i not in merged and j not in merged:
+                pairs.append((i, j))
+                merged.update((i, j))
+        if not pairs:
+            return self
+        removed = {j for _, j in pairs}
+        idxs1 = torch.LongTensor([i for i, _ in pairs])
+        idxs2 = torch.LongTensor([j for _, j in pairs])
+        keep = torch.LongTensor([i for i in range(n_components)
+                                 if i not in removed])
+
+        # Merge the weights.
+        weights_np = []
+        for density in [self.prior_weights, self.posterior_weights]:
+            nparams = density.natural_params.clone()
+            nparams[idxs1] += nparams[idxs2]
+            weights_np.append(nparams[keep])
+        new_prior_weights = DirichletPrior(weights_np[0] + 1)
+        new_posterior_weights = DirichletPrior(weights_np[1] + 1)
+
+        # Merge the components.
+        prior_np = self._priors.natural_params.clone()
+        post_np = self._posteriors.natural_params.clone()
+        prior_np[idxs1] = .5 * (prior_np[idxs1] + prior_np[idxs2])
+        post_np[idxs1] += post_np[idxs2] - prior_np[idxs1]
+        priors, posteriors = copy.copy(self._priors), copy.copy(self._posteriors)
+        priors.natural_params = prior_np[keep]
+        posteriors.natural_params = post_np[keep]
+        new_components = [type(self.components[idx])(prior, posterior)
+            for idx, prior, posterior in zip(keep.tolist(), priors, posteriors)]
+
+        return Mixture(new_prior_weights, new_components,
+                       new_posterior_weights)
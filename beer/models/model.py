@@ -2,6 +2,18 @@
 '''Abstract Base Class for a model.'''
 
 import abc
+import numpy as np
+import torch
+
+
+def _select_frames(X, mask):
+    'Frames of X selected by the mask (all the frames if mask is None).'
+    if mask is None:
+        return X
+    mask = np.asarray(mask, dtype=bool)
+    if isinstance(X, np.ndarray):
+        return X[mask]
+    return X[torch.as_tensor(mask)]
 
 
 class Model(metaclass=abc.ABCMeta):
@@ -17,7 +29,7 @@ class ConjugateExponentialModel(metaclass=abc.ABCMeta):
 
 
     @abc.abstractmethod
-    def exp_llh(self, X, accumulate=False):
+    def exp_llh(self, X, accumulate=False, mask=None):
         """Expected value of the log-likelihood w.r.t to the posterior
         distribution over the parameters.
 
@@ -25,10 +37,14 @@ class ConjugateExponentialModel(metaclass=abc.ABCMeta):
             X (numpy.ndarray): Data as a matrix.
             accumulate (boolean): If True, returns the accumulated
                 statistics.
+            mask (numpy.ndarray): Boolean mask of the frames to
+                process (see :func:`beer.features.select_frames`).
+                The other frames are ignored.
 
         Returns:
             numpy.ndarray: Per-frame expected value of the
-                log-likelihood.
+                log-likelihood (of the selected frames only if
+                ``mask`` is given).
             numpy.ndarray: Accumulated statistics (if ``accumulate=True``).
 
         """
@@ -8,15 +8,23 @@ import abc
 import math
 
 import torch
-import torch.autograd as ta
 
 from .model import ConjugateExponentialModel
+from .model import _select_frames
+from ..precision import compute_dtype, stats_dtype
 from ..expfamily import NormalGammaPrior
 from ..expfamily import NormalWishartPrior
 from ..expfamily import kl_div
 from ..expfamily import _normalwishart_split_nparams
 
 
+def _chunk_size(row_size, max_elements=2**20):
+    # Number of frames per chunk so that the (frames x row_size)
+    # temporaries of the full covariance computations stay below
+    # "max_elements".
+    return max(1, max_elements // row_size)
+
+
 class Normal(ConjugateExponentialModel, metaclass=abc.ABCMeta):
     'Abstract Base Class for the Normal distribution model.'
 
@@ -121,6 +129,39 @@ class Normal(ConjugateExponentialModel, metaclass=abc.ABCMeta):
         '''
         NotImplemented
 
+    @classmethod
+    def _exp_llh_matrix(cls, X, exp_natural_params):
+        '''Inner products between the sufficient statistics of the data
+        and K sets of expected natural parameters (N x K matrix).
+
+        '''
+        return cls.sufficient_statistics(X) @ exp_natural_params.t()
+
+    @classmethod
+    def _accumulate(cls, X, weights):
+        '''Sums of the sufficient statistics of the data weighted by
+        each column of ``weights`` (K x P matrix).
+
+        '''
+        T = cls.sufficient_statistics(X).to(stats_dtype())
+        return weights.to(stats_dtype()).t() @ T
+
+    def exp_llh(self, X, accumulate=False, mask=None):
+        X = _select_frames(X, mask).to(compute_dtype())
+        exp_natural_params = \
+            self.posterior.expected_sufficient_statistics.to(X.dtype)
+
+        # Note: the lognormalizer is already included in the expected
+        # value of the natural parameters.
+        exp_llh = self._exp_llh_matrix(X, exp_natural_params[None])[:, 0] \
+            - .5 * X.shape[1] * math.log(2 * math.pi)
+
+        if accumulate:
+            acc_stats = self._accumulate(X, torch.ones_like(X[:, :1]))[0]
+            return exp_llh, acc_stats
+
+        return exp_llh
+
     def kl_div_posterior_prior(self):
         '''KL divergence between the posterior and prior distribution.
 
@@ -145,9 +186,8 @@ class Normal(ConjugateExponentialModel, metaclass=abc.ABCMeta):
             - self.posterior.natural_params
 
         # Update the posterior distribution.
-        self.posterior.natural_params = ta.Variable(
-            self.posterior.natural_params + lrate * natural_grad,
-            requires_grad=True)
+        self.posterior.natural_params = self.posterior.natural_params \
+            + lrate * natural_grad
 
     def split(self, prior_count=1.):
         '''Split the distribution into two Normal distribution (of the
@@ -161,7 +201,7 @@ class Normal(ConjugateExponentialModel, metaclass=abc.ABCMeta):
             ``Normal``: Second Normal distribution.
 
         '''
-        evals, evecs = torch.symeig(self.cov, eigenvectors=True)
+        evals, evecs = torch.linalg.eigh(self.cov)
         mean1 = self.mean + evecs.t() @ torch.sqrt(evals)
         mean2 = self.mean - evecs.t() @ torch.sqrt(evals)
         return self.create(mean1, self.cov, self.count), \
@@ -236,23 +276,8 @@ class NormalDiagonalCovariance(Normal):
         return torch.cat([
             np1.view(1, -1), np2.view(1, -1),
             np3.sum(dim=-1).view(1, -1),
-            np4.sum(dim=-1).view(1, -1)], dim=-1), \
-            T.sum(dim=0)
-
-    def exp_llh(self, X, accumulate=False):
-        T = self.sufficient_statistics(X)
-        exp_natural_params = self.posterior.expected_sufficient_statistics
-
-        # Note: the lognormalizer is already included in the expected
-        # value of the natural parameters.
-        exp_llh = T @ exp_natural_params - \
-            .5 * X.shape[1] * math.log(2 * math.pi)
-
-        if accumulate:
-            acc_stats = T.sum(dim=0)
-            return exp_llh, acc_stats
-
-        return exp_llh
+            np4.sum(dim=-1).view(1, -1)], dim=-1).to(compute_dtype()), \
+            T.sum(dim=0, dtype=stats_dtype())
 
 
 class NormalFullCovariance(Normal):
@@ -273,15 +298,18 @@ class NormalFullCovariance(Normal):
 
     @staticmethod
     def sufficient_statistics(X):
-        return torch.cat([(X[:, :, None] * X[:, None, :]).view(len(X), -1),
+        # The second order statistics are stored as the packed
+        # upper-triangular part of x x^T.
+        rows, cols = torch.triu_indices(X.size(1), X.size(1))
+        return torch.cat([X[:, rows] * X[:, cols],
             X, torch.ones(X.size(0), 1).type(X.type()),
             torch.ones(X.size(0), 1).type(X.type())], dim=-1)
 
     @staticmethod
     def sufficient_statistics_from_mean_var(mean, var):
-        idxs = torch.eye(mean.size(1)).view(-1) == 1
-        XX = (mean[:, :, None] * mean[:, None, :]).view(mean.shape[0], -1)
-        XX[:, idxs] += var
+        rows, cols = torch.triu_indices(mean.size(1), mean.size(1))
+        XX = mean[:, rows] * mean[:, cols]
+        XX[:, rows == cols] += var
         return torch.cat([XX, mean, torch.ones(len(mean), 1).type(mean.type()),
             torch.ones(len(mean), 1).type(mean.type())], dim=-1)
 
@@ -292,14 +320,16 @@ class NormalFullCovariance(Normal):
     @property
     def mean(self):
         nparams = self.posterior.expected_sufficient_statistics
-        np1, np2, _, _, _ = _normalwishart_split_nparams(nparams)
-        return torch.inverse(-2 * np1) @ np2
+        np1, np2, _, _, _ = _normalwishart_split_nparams(nparams,
+                                                         exp_stats=True)
+        return torch.linalg.solve(-2 * np1, np2)
 
     @property
     def cov(self):
         nparams = self.posterior.expected_sufficient_statistics
-        np1, _, _, _, _ = _normalwishart_split_nparams(nparams)
-        return torch.inverse(-2 * np1)
+        np1, _, _, _, _ = _normalwishart_split_nparams(nparams,
+                                                       exp_stats=True)
+        return torch.linalg.inv(-2 * np1)
 
     @property
     def count(self):
@@ -307,21 +337,63 @@ class NormalFullCovariance(Normal):
 
     def expected_natural_params(self, mean, var):
         T = self.sufficient_statistics_from_mean_var(mean, var)
-        return self.posterior.expected_sufficient_statistics.view(1, -1), \
-             T.sum(dim=0)
-
-    def exp_llh(self, X, accumulate=False):
-        T = self.sufficient_statistics(X)
-        exp_natural_params = self.posterior.expected_sufficient_statistics
+        np1, np2, np3, np4, _ = _normalwishart_split_nparams(
+            self.posterior.expected_sufficient_statistics, exp_stats=True)
+        # The quadratic term is expanded back to the full (D x D)
+        # matrix as expected by the states of the VAE.
+        exp_natural_params = torch.cat([np1.reshape(-1), np2, np3.view(1),
+                                        np4.view(1)])
+        return exp_natural_params.view(1, -1).to(compute_dtype()), \
+             T.sum(dim=0, dtype=stats_dtype())
 
-        # Note: the lognormalizer is already included in the expected
-        # value of the natural parameters.
-        exp_llh = T @ exp_natural_params - \
-            .5 * X.shape[1] * math.log(2 * math.pi)
-
-        if accumulate:
-            acc_stats = T.sum(dim=0)
-            return exp_llh, acc_stats
+    @staticmethod
+    def _exp_llh_matrix(X, exp_natural_params):
+        # x^T A x + b^T x + c for each row of the expected natural
+        # parameters. The (N x D(D+1)/2) sufficient statistics are
+        # never built for all the frames at once.
+        K, D = len(exp_natural_params), X.size(1)
+        rows, cols = torch.triu_indices(D, D)
+        P = len(rows)
+        linear = X @ exp_natural_params[:, P:P + D].t() \
+            + exp_natural_params[:, -2] + exp_natural_params[:, -1]
+
+        # The quadratic form costs K D^2 products per frame against
+        # (K + 1) D(D+1)/2 for the packed outer products (built once
+        # for all the components), so it only wins for very few
+        # components. The K matrices are then concatenated in a
+        # (D x K*D) matrix so each chunk needs a single product.
+        if K * D * D < (K + 1) * P:
+            np1, _, _, _, _ = _normalwishart_split_nparams(
+                exp_natural_params, exp_stats=True)
+            matrices = np1.permute(1, 0, 2).reshape(D, K * D)
+            quad = torch.cat([
+                torch.bmm((chunk @ matrices).view(len(chunk), K, D),
+                          chunk[:, :, None])[:, :, 0]
+                for chunk in X.split(_chunk_size(K * D))
+            ])
+            return quad + linear
+
+        # Same as in "_accumulate": packed outer products of a bounded
+        # chunk of frames and one product with the (K x P) packed
+        # expectations.
+        packed_params = exp_natural_params[:, :P].t()
+        quad = torch.cat([(chunk[:, rows] * chunk[:, cols]) @ packed_params
+                          for chunk in X.split(_chunk_size(P))])
+        return quad + linear
 
-        return exp_llh
+    @staticmethod
+    def _accumulate(X, weights):
+        # Weighted second order statistics X^T diag(w) X (packed) for
+        # all the K columns of the weights at once. The packed outer
+        # products are built for one chunk of frames at a time so the
+        # memory does not grow with the number of frames.
+        X, weights = X.to(stats_dtype()), weights.to(stats_dtype())
+        rows, cols = torch.triu_indices(X.size(1), X.size(1))
+        XX = weights.new_zeros(weights.size(1), len(rows))
+        chunk_size = _chunk_size(len(rows))
+        for chunk, w_chunk in zip(X.split(chunk_size),
+                                  weights.split(chunk_size)):
+            XX += w_chunk.t() @ (chunk[:, rows] * chunk[:, cols])
+        counts = weights.sum(dim=0)[:, None]
+        return torch.cat([XX, weights.t() @ X, counts, counts], dim=-1)
 
@@ -9,10 +9,10 @@ import math
 
 import torch
 from torch import nn
-from torch.autograd import Variable
 import numpy as np
 
 from .model import Model
+from ..precision import compute_dtype
 from ..training import mini_batches
 
 
@@ -39,7 +39,7 @@ class VAE(nn.Module):
 
     def evaluate(self, data, sampling=True):
         'Convenience function mostly for plotting and debugging.'
-        torch_data = Variable(torch.from_numpy(data).float())
+        torch_data = torch.from_numpy(data).to(compute_dtype())
         state = self(torch_data, sampling=sampling)
         loss, llh, kld = self.loss(torch_data, state)
         return -loss, llh, kld, state['encoder_state'].mean, \
@@ -84,7 +84,7 @@ class VAE(nn.Module):
 
         return {
             'encoder_state': encoder_state,
-            'p_np_params': Variable(torch.FloatTensor(p_np_params)),
+            'p_np_params': p_np_params.to(compute_dtype()),
             'acc_stats': acc_stats,
             'decoder_state': decoder_state,
             'nsamples': nsamples
@@ -179,14 +179,15 @@ class MLPStateNormal(MLPEncoderState, MLPDecoderState):
         XX = self.mean[:, :, None] * self.mean[:, None, :]
         XX[:, idxs, idxs] += 1 / self.prec
         return torch.cat([XX.view(self.mean.size(0), -1), self.mean,
-                          Variable(torch.ones(self.mean.size(0), 2))], dim=-1)
+                          torch.ones(self.mean.size(0), 2).type(self.mean.type())],
+                         dim=-1)
 
     @property
     def std_dev(self):
         return 1 / torch.sqrt(self.prec)
 
     def natural_params(self):
-        identity = Variable(torch.eye(self.mean.size(1)))
+        identity = torch.eye(self.mean.size(1)).type(self.mean.type())
         np1 = -.5 * self.prec[:, None] * identity[None, :, :]
         np1 = np1.view(self.mean.size(0), -1)
         np2 = self.prec * self.mean
@@ -195,7 +196,7 @@ class MLPStateNormal(MLPEncoderState, MLPDecoderState):
         return torch.cat([np1, np2, np3, np4], dim=-1)
 
     def sample(self):
-        noise = Variable(torch.randn(*self.mean.size()))
+        noise = torch.randn(*self.mean.size()).type(self.mean.type())
         return self.mean + self.std_dev * noise
 
     def kl_div(self, p_nparams):
@@ -204,7 +205,7 @@ class MLPStateNormal(MLPEncoderState, MLPDecoderState):
     def sufficient_statistics(self, X):
         XX = X[:, :, None] * X[:, None, :]
         return torch.cat([XX.view(X.size(0), -1), X,
-                          Variable(torch.ones(X.size(0), 2).float())], dim=-1)
+                          torch.ones(X.size(0), 2).type(X.type())], dim=-1)
 
     def log_base_measure(self, X):
         return -.5 * X.size(-1) * math.log(2 * math.pi)
@@ -230,7 +231,8 @@ class MLPModel(nn.Module):
         dim = max(*W.shape)
         q, _ = np.linalg.qr(np.random.randn(dim, dim))
         W = q[:W.shape[0], :W.shape[1]]
-        linear_transform.weight = nn.Parameter(torch.from_numpy(W).float())
+        linear_transform.weight = nn.Parameter(
+            torch.from_numpy(W).to(compute_dtype()))
 
     def __init__(self, structure, outputs):
         '''Initialize the ``MLPModel``.
@@ -267,6 +269,9 @@ class MLPModel(nn.Module):
                 self.residual_connections.append(ltransform)
                 self.residual_mapping[i] = len(self.residual_connections) - 1
 
+        # Parameters of the network with the compute type.
+        self.to(compute_dtype())
+
     def forward(self, X):
         h = self.structure(X)
         outputs = [transform(h) for transform in self.output_layer]
@@ -321,5 +326,5 @@ class MLPNormalIso(MLPModel):
     def forward(self, X):
         mean, logprec = super().forward(X)
         return MLPStateNormal(mean,
-            torch.exp(logprec) * Variable(torch.ones(mean.size(1)).float()))
+            torch.exp(logprec) * torch.ones(mean.size(1)).type(mean.type()))
 
@@ -0,0 +1,121 @@
+'''Frame by frame scoring of live audio.'''
+
+
+import time
+import numpy as np
+import torch
+
+from . import features
+
+
+class OnlineScorer:
+    '''Score audio chunks against a trained model as they arrive.
+
+    The audio goes through the following stages:
+
+        chunk -> FBANK -> derivatives -> normalization -> model
+
+    each of them keeping only the state needed to process the next
+    chunk. For every frame completed by a chunk, the scorer returns
+    the expected log-likelihood of the frame and, for mixture models,
+    the responsibilities of the components.
+
+    Example:
+        >>> scorer = OnlineScorer(gmm, fea_args={'nfilters': 30})
+        >>> for chunk in audio_chunks(stream, chunk_size=160):
+        ...     exp_llh, resps = scorer(chunk)
+        >>> exp_llh, resps = scorer.flush()
+
+    '''
+
+    def __init__(self, model, fea_args={}, winlens=(2, 2), stats=None):
+        '''Initialize the pipeline.
+
+        Args:
+            model (``ConjugateExponentialModel``): Model to score the
+                features with.
+            fea_args (dict): Arguments of the FBANK features (see
+                :func:`beer.features.fbank`).
+            winlens (tuple): Window lengths of the derivatives (None or
+                () for no derivatives).
+            stats (``beer.features.MeanVarianceStats``): Statistics to
+                normalize the features (None for no normalization).
+
+        '''
+        self.model = model
+        self.stats = stats
+        self.fbank = features.OnlineFbank(**fea_args)
+        self.deltas = features.OnlineDeltas(winlens) if winlens else None
+        self.timings = {'fbank': 0., 'deltas': 0., 'model': 0.}
+        self.nframes = 0
+
+    @property
+    def latency(self):
+        '''Algorithmic latency in samples: number of samples after the
+        beginning of a frame needed before it can be scored.
+
+        '''
+        lookahead = self.deltas.latency if self.deltas is not None else 0
+        return self.fbank.flen_samp + lookahead * self.fbank.frate_samp
+
+    def _score(self, fea):
+        start_time = time.perf_counter()
+        if self.stats is not None:
+            fea = self.stats.normalize(fea)
+        X = torch.from_numpy(np.ascontiguousarray(fea))
+        if hasattr(self.model, 'responsibilities'):
+            exp_llh, resps = self.model.responsibilities(X)
+        else:
+            exp_llh, resps = self.model.exp_llh(X), None
+        self.timings['model'] += time.perf_counter() - start_time
+        self.nframes += len(fea)
+        return exp_llh, resps
+
+    def __call__(self, chunk):
+        '''Process a new chunk of audio.
+
+        Args:
+            chunk (numpy.ndarray): Audio samples.
+
+        Returns:
+            Tensor: Expected log-likelihood of the frames completed by
+                the chunk.
+            Tensor: Responsibilities of the components for these
+                frames (None if the model is not a mixture).
+
+        '''
+        start_time = time.perf_counter()
+        fea = self.fbank(chunk)
+        self.timings['fbank'] += time.perf_counter() - start_time
+        if self.deltas is not None:
+            start_time = time.perf_counter()
+            fea = self.deltas(fea)
+            self.timings['deltas'] += time.perf_counter() - start_time
+        return self._score(fea)
+
+    def flush(self):
+        '''End the stream and score the remaining frames.
+
+        Returns:
+            See :meth:`__call__`.
+
+        '''
+        if self.deltas is None:
+            return self._score(np.zeros((0, self.fbank.nfilters)))
+        start_time = time.perf_counter()
+        fea = self.deltas.flush()
+        self.timings['deltas'] += time.perf_counter() - start_time
+        if len(fea) == 0:
+            fea = np.zeros((0, self.fbank.nfilters * (1 + len(self.deltas.winlens))))
+        return self._score(fea)
+
+    def time_per_frame(self):
+        '''Average compute time (in seconds) per frame of each stage.
+
+        Returns:
+            dict: Time per frame for each stage.
+
+        '''
+        nframes = max(self.nframes, 1)
+        return {stage: duration / nframes
+                for stage, duration in self.timings.items()}
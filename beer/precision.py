@@ -0,0 +1,89 @@
+'''Numeric precision policy.
+
+beer uses two floating point types:
+
+  * the *compute* type (float32 by default) for the features, the
+    expected log-likelihood of the models and the neural networks of
+    the VAE,
+  * the *statistics* type (float64 by default) for the accumulated
+    sufficient statistics and the natural parameters of the
+    priors/posteriors (and therefore the natural gradient updates).
+
+Example:
+    >>> beer.precision.set_precision(compute='float64')
+    >>> with beer.precision.precision(compute=torch.float64):
+    ...     exp_llh = model.exp_llh(X)
+
+'''
+
+import contextlib
+import numpy as np
+import torch
+
+
+_POLICY = {'compute': torch.float32, 'stats': torch.float64}
+
+
+def _torch_dtype(dtype):
+    if isinstance(dtype, torch.dtype):
+        return dtype
+    return torch.from_numpy(np.zeros(0, dtype=np.dtype(dtype))).dtype
+
+
+def _numpy_dtype(dtype):
+    return torch.zeros(0, dtype=dtype).numpy().dtype
+
+
+def set_precision(compute=None, stats=None):
+    '''Set the floating point types used by beer.
+
+    Args:
+        compute (dtype): Type of the computations (torch or numpy
+            type or its name). Unchanged if None.
+        stats (dtype): Type of the accumulated statistics and of the
+            natural parameters. Unchanged if None.
+
+    '''
+    if compute is not None:
+        _POLICY['compute'] = _torch_dtype(compute)
+    if stats is not None:
+        _POLICY['stats'] = _torch_dtype(stats)
+
+
+@contextlib.contextmanager
+def precision(compute=None, stats=None):
+    '''Context manager to change temporarily the floating point types
+    (see :func:`set_precision`).
+
+    '''
+    previous = dict(_POLICY)
+    set_precision(compute, stats)
+    try:
+        yield
+    finally:
+        _POLICY.update(previous)
+
+
+def compute_dtype(numpy=False):
+    '''Floating point type of the computations.
+
+    Args:
+        numpy (boolean): Return the numpy type instead of the torch
+            type.
+
+    '''
+    dtype = _POLICY['compute']
+    return _numpy_dtype(dtype) if numpy else dtype
+
+
+def stats_dtype(numpy=False):
+    '''Floating point type of the accumulated statistics and of the
+    natural parameters.
+
+    Args:
+        numpy (boolean): Return the numpy type instead of the torch
+            type.
+
+    '''
+    dtype = _POLICY['stats']
+    return _numpy_dtype(dtype) if numpy else dtype
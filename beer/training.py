@@ -2,9 +2,11 @@ import numpy as np
 
 import torch
 from torch.utils.data import DataLoader
-from torch.autograd import Variable
 from torch import optim
 
+from .models.model import _select_frames
+from .precision import compute_dtype, stats_dtype
+
 def mini_batches(data, mini_batch_size, seed=None):
     rng = np.random.RandomState()
     if seed is not None:
@@ -16,7 +18,8 @@ def mini_batches(data, mini_batch_size, seed=None):
 
 
 def train_vae(model, data, mini_batch_size=-1, max_epochs=1, seed=None, lrate=1e-3,
-        latent_model_lrate=1., kl_weight=1.0, sample=True, callback=None):
+        latent_model_lrate=1., kl_weight=1.0, sample=True, callback=None,
+        mask=None):
     ''' Train a VAE model.
 
     Args:
@@ -30,8 +33,11 @@ def train_vae(model, data, mini_batch_size=-1, max_epochs=1, seed=None, lrate=1e
         kl_weight (float): multiplicative factor for the KLD term
         sample (boolen): let the VAE sample in the latent space
         callback (): function to collect training progress. Not extremely versatile now
+        mask (numpy.ndarray): Boolean mask of the frames to train on
+            (see :func:`beer.features.select_frames`).
     '''
 
+    data = _select_frames(data, mask)
     optimizer = optim.Adam(model.parameters(), lr=lrate, weight_decay=1e-6)
     data_size = np.prod(data.shape[:-1])
     mb_size = mini_batch_size if mini_batch_size > 0 else len(data)
@@ -40,7 +46,7 @@ def train_vae(model, data, mini_batch_size=-1, max_epochs=1, seed=None, lrate=1e
     for epoch in range(1, max_epochs + 1):
         for mini_batch in dataloader:
             # Forward the data through the VAE.
-            X = Variable(mini_batch)
+            X = mini_batch.to(compute_dtype())
             state = model(X, sample)
 
             nb_datapoints_in_batch = np.prod(mini_batch.shape[:-1])
@@ -76,7 +82,7 @@ def train_vae(model, data, mini_batch_size=-1, max_epochs=1, seed=None, lrate=1e
                 callback(float(lower_bound), float(llh), float(kld))
 
 def train_loglinear_model(model, data, mini_batch_size=-1, max_epochs=1, seed=None,
-        lrate=1., callback=None):
+        lrate=1., callback=None, mask=None):
     '''Train a VAE model.
 
     Args:
@@ -87,8 +93,11 @@ def train_loglinear_model(model, data, mini_batch_size=-1, max_epochs=1, seed=No
         lrate (float): learning rate for natural gradient updates
         callback (function): Function to collect training progress.
             Not extremely versatile now
+        mask (numpy.ndarray): Boolean mask of the frames to train on
+            (see :func:`beer.features.select_frames`).
 
     '''
+    data = _select_frames(data, mask)
     data_size = float(data.size(0))
     mb_size = mini_batch_size if mini_batch_size > 0 else len(data)
     dataloader = DataLoader(data, batch_size=mb_size, shuffle=True)
@@ -97,7 +106,7 @@ def train_loglinear_model(model, data, mini_batch_size=-1, max_epochs=1, seed=No
             mini_batch_size = float(mini_batch.size(0))
             scale = data_size / mini_batch_size
             exp_llhs, acc_stats = model.exp_llh(mini_batch, accumulate=True)
-            exp_llh = torch.sum(exp_llhs)
+            exp_llh = torch.sum(exp_llhs, dtype=stats_dtype())
             kld = model.kl_div_posterior_prior()
             lower_bound = (scale * exp_llh - kld)
             model.natural_grad_update(acc_stats, scale, lrate)
@@ -0,0 +1,38 @@
+'''Benchmark of the batched FBANK extraction against calling
+``beer.features.fbank`` in a loop.
+
+Usage:
+    python benchmarks/bench_fbank_batch.py
+
+'''
+
+
+import sys
+sys.path.insert(0, './')
+import timeit
+import numpy as np
+import beer
+
+
+NUTTS = 300
+DURATIONS = [1, 2, 3]
+SRATE = 16000
+
+
+def main():
+    print('{:>12} {:>10} {:>12} {:>8}'.format('duration (s)', 'loop (s)',
+          'batch (s)', 'speedup'))
+    rng = np.random.RandomState(0)
+    for duration in DURATIONS:
+        signals = [rng.randint(-2**15, 2**15, size=duration * SRATE + offset)
+                   .astype(np.int16) for offset in rng.randint(0, 800, NUTTS)]
+        loop = lambda: [beer.features.fbank(signal) for signal in signals]
+        batch = lambda: beer.features.fbank_batch(signals)
+        times = [min(timeit.repeat(func, number=1, repeat=5))
+                 for func in [loop, batch]]
+        print('{:>12} {:>10.3f} {:>12.3f} {:>7.1f}x'.format(duration,
+              times[0], times[1], times[0] / times[1]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,41 @@
+'''Benchmark of the dense and sparse filterbank application (the
+ratio is the time of the sparse product over the dense one).
+
+Usage:
+    python benchmarks/bench_filterbank.py
+
+'''
+
+
+import sys
+sys.path.insert(0, './')
+import timeit
+import numpy as np
+import beer
+
+
+NFRAMES = 6000
+CONFIGS = [(26, 512), (40, 512), (80, 1024), (128, 2048), (256, 4096)]
+
+
+def main():
+    print('{:>8} {:>8} {:>12} {:>12} {:>8}'.format('nfilters', 'fft_len',
+          'dense (ms)', 'sparse (ms)', 'ratio'))
+    for nfilters, fft_len in CONFIGS:
+        # Same layout and type as in beer.features.fbank.
+        magspec = np.abs(np.random.randn(NFRAMES, fft_len // 2)).astype(
+            beer.precision.compute_dtype(numpy=True))
+        dense = beer.features.create_fbank(nfilters, fft_len).T.astype(
+            magspec.dtype)
+        sparse = beer.features.create_fbank(nfilters, fft_len,
+                                            sparse=True).astype(magspec.dtype)
+        products = [lambda: magspec @ dense,
+                    lambda: np.ascontiguousarray((sparse @ magspec.T).T)]
+        times = [min(timeit.repeat(product, number=10, repeat=5)) / 10
+                 for product in products]
+        print('{:>8} {:>8} {:>12.3f} {:>12.3f} {:>7.1f}x'.format(nfilters,
+              fft_len, 1e3 * times[0], 1e3 * times[1], times[1] / times[0]))
+
+
+if __name__ == '__main__':
+    main()
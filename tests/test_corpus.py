@@ -0,0 +1,93 @@
+'Test the corpus module.'
+
+
+import os
+import sys
+sys.path.insert(0, './')
+import tempfile
+import unittest
+import unittest.mock
+import beer
+import numpy as np
+
+
+class TestExtractCorpus(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.s_t = np.load('tests/audio.npy')
+        self.utterances = []
+        for i in range(5):
+            path = os.path.join(self.tmpdir.name, 'utt{}.npy'.format(i))
+            np.save(path, self.s_t[i * 100:])
+            self.utterances.append(('utt{}'.format(i), path))
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_extract_corpus(self):
+        outdir = os.path.join(self.tmpdir.name, 'fea')
+        progress = []
+        failures = beer.corpus.extract_corpus(self.utterances, outdir,
+            nworkers=2, fea_args={'nfilters': 30, 'lowfreq': 100},
+            callback=lambda *args: progress.append(args))
+        self.assertEqual(failures, {})
+        self.assertEqual([p[2] for p in progress],
+                         [uttid for uttid, _ in self.utterances])
+        for i, (uttid, _) in enumerate(self.utterances):
+            fea = beer.features.fbank(self.s_t[i * 100:], nfilters=30,
+                                      lowfreq=100)
+            ref_fea = beer.features.add_deltas(fea)
+            fea = np.load(os.path.join(outdir, uttid + '.npy'))
+            self.assertTrue(np.allclose(ref_fea, fea))
+
+    def test_extract_corpus_archive(self):
+        outdir = os.path.join(self.tmpdir.name, 'fea')
+        failures = beer.corpus.extract_corpus(self.utterances, outdir,
+            nworkers=2, archive=True)
+        self.assertEqual(failures, {})
+        archive = beer.io.FeatureArchive(os.path.join(outdir, 'feats'))
+        self.assertEqual(list(archive.keys()),
+                         [uttid for uttid, _ in self.utterances])
+        for i, (uttid, _) in enumerate(self.utterances):
+            ref_fea = beer.features.add_deltas(
+                beer.features.fbank(self.s_t[i * 100:]))
+            self.assertTrue(np.allclose(ref_fea, archive[uttid]))
+
+    def test_extract_corpus_cache(self):
+        cache = beer.io.FeatureCache(os.path.join(self.tmpdir.name, 'cache'))
+        for i in range(2):
+            outdir = os.path.join(self.tmpdir.name, 'fea{}'.format(i))
+            failures = beer.corpus.extract_corpus(self.utterances, outdir,
+                nworkers=2, cache=cache)
+            self.assertEqual(failures, {})
+        self.assertEqual(len(os.listdir(cache.cachedir)), len(self.utterances))
+        for uttid, _ in self.utterances:
+            self.assertTrue(np.array_equal(
+                np.load(os.path.join(self.tmpdir.name, 'fea0', uttid + '.npy')),
+                np.load(os.path.join(self.tmpdir.name, 'fea1', uttid + '.npy'))))
+
+    def test_extract_corpus_cache_scans(self):
+        cache = beer.io.FeatureCache(os.path.join(self.tmpdir.name, 'cache'))
+        outdir = os.path.join(self.tmpdir.name, 'fea')
+        evict = beer.io.FeatureCache._evict
+        with unittest.mock.patch.object(beer.io.FeatureCache, '_evict',
+                autospec=True, side_effect=evict) as mock_evict:
+            failures = beer.corpus.extract_corpus(self.utterances, outdir,
+                nworkers=2, chunksize=1, cache=cache)
+        self.assertEqual(failures, {})
+        # The features are stored by the main process: the directory is
+        # scanned once (size of the cache unknown) for all the jobs.
+        self.assertEqual(mock_evict.call_count, 1)
+        self.assertEqual(len(os.listdir(cache.cachedir)), len(self.utterances))
+
+    def test_failures(self):
+        outdir = os.path.join(self.tmpdir.name, 'fea')
+        utterances = self.utterances + [('bad', '/does/not/exist.npy')]
+        failures = beer.corpus.extract_corpus(utterances, outdir, nworkers=2)
+        self.assertEqual(list(failures.keys()), ['bad'])
+        self.assertEqual(len(os.listdir(outdir)), len(self.utterances))
+
+
+if __name__ == '__main__':
+    unittest.main()
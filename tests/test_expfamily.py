@@ -48,9 +48,12 @@ def normalgamma_grad_log_norm(natural_params):
 
 
 def normalwishart_split_np(natural_params):
-    D = int(.5 * (-1 + np.sqrt(1 + 4 * len(natural_params[:-2]))))
-    np1, np2 = natural_params[:int(D**2)].reshape(D, D), \
-         natural_params[int(D**2):-2]
+    D = int(round(.5 * (-3 + np.sqrt(8 * len(natural_params) - 7))))
+    P = D * (D + 1) // 2
+    np1 = np.zeros((D, D), dtype=natural_params.dtype)
+    np1[np.triu_indices(D)] = natural_params[:P]
+    np1 = np1 + np.triu(np1, 1).T
+    np2 = natural_params[P:-2]
     np3, np4 = natural_params[-2:]
     return np1, np2, np3, np4, D
 
@@ -78,7 +81,9 @@ def normalwishart_grad_log_norm(natural_params):
         * np.trace(inv_matrix @ (outer / np3))
     grad4 = .5 * np.sum(psi(.5 * (np4 + D + 1 - np.arange(1, D + 1, 1))))
     grad4 += -.5 * sign * logdet + .5 * D * np.log(2)
-    return np.hstack([grad1.reshape(-1), grad2, grad3, grad4])
+    # The off-diagonal packed parameters stand for 2 entries.
+    grad1 = (2 * grad1 - np.diag(np.diag(grad1)))[np.triu_indices(D)]
+    return np.hstack([grad1, grad2, grad3, grad4])
 
 
 #######################################################################
@@ -101,12 +106,55 @@ class TestDirichletPrior:
         s_stats = dirichlet_grad_log_norm(natural_params)
         self.assertTrue(np.allclose(model_s_stats, s_stats, rtol=TOL, atol=TOL))
 
+    def test_autograd_exp_sufficient_statistics(self):
+        model = beer.DirichletPrior(self.prior_counts)
+        s_stats1 = model.expected_sufficient_statistics.numpy()
+        s_stats2 = model.autograd_expected_sufficient_statistics().numpy()
+        self.assertTrue(np.allclose(s_stats1, s_stats2, rtol=TOL, atol=TOL))
+
+    def test_lazy_evaluation(self):
+        model = beer.DirichletPrior(self.prior_counts)
+        self.assertEqual(model.version, 1)
+        self.assertTrue(model._log_norm is None)
+        model.natural_params = model.natural_params + 1
+        self.assertEqual(model.version, 2)
+        self.assertTrue(model._expected_sufficient_statistics is None)
+        s_stats = dirichlet_grad_log_norm(model.natural_params.numpy())
+        self.assertTrue(np.allclose(
+            model.expected_sufficient_statistics.numpy(), s_stats,
+            rtol=TOL, atol=TOL))
+
     def test_kl_divergence(self):
         model1 = beer.DirichletPrior(self.prior_counts)
         model2 = beer.DirichletPrior(self.prior_counts)
         div = beer.kl_div(model1, model2)
         self.assertAlmostEqual(div, 0.)
 
+    def test_batch(self):
+        models = [beer.DirichletPrior(self.prior_counts * scale)
+                  for scale in [1., 2., 3.]]
+        batch = beer.BatchExpFamilyDensity.from_densities(models)
+        self.assertEqual(len(batch), len(models))
+        for i, model in enumerate(models):
+            self.assertTrue(np.allclose(model.log_norm.numpy(),
+                batch.log_norm[i].numpy(), rtol=TOL, atol=TOL))
+            self.assertTrue(np.allclose(
+                model.expected_sufficient_statistics.numpy(),
+                batch[i].expected_sufficient_statistics.numpy(),
+                rtol=TOL, atol=TOL))
+        kl_divs = beer.kl_div(batch, models[0]).numpy()
+        for i, model in enumerate(models):
+            self.assertAlmostEqual(float(beer.kl_div(model, models[0])),
+                                   float(kl_divs[i]), places=3)
+        kl_divs = beer.pairwise_kl_div(batch, symmetric=False).numpy()
+        sym_kl_divs = beer.pairwise_kl_div(batch).numpy()
+        for i, model1 in enumerate(models):
+            for j, model2 in enumerate(models):
+                kl_div = float(beer.kl_div(model1, model2))
+                self.assertAlmostEqual(kl_div / max(1, abs(kl_div)),
+                    float(kl_divs[i, j]) / max(1, abs(kl_div)), places=3)
+        self.assertTrue(np.allclose(sym_kl_divs, kl_divs + kl_divs.T))
+
     def test_log_norm(self):
         model = beer.DirichletPrior(self.prior_counts)
         model_log_norm = model.log_norm.numpy()
@@ -130,6 +178,13 @@ class TestNormalGammaPrior:
         s_stats = normalgamma_grad_log_norm(natural_params)
         self.assertTrue(np.allclose(model_s_stats, s_stats, rtol=TOL, atol=TOL))
 
+    def test_autograd_exp_sufficient_statistics(self):
+        model = beer.NormalGammaPrior(self.mean, self.precision,
+                                      self.prior_count)
+        s_stats1 = model.expected_sufficient_statistics.numpy()
+        s_stats2 = model.autograd_expected_sufficient_statistics().numpy()
+        self.assertTrue(np.allclose(s_stats1, s_stats2, rtol=TOL, atol=TOL))
+
     def test_kl_divergence(self):
         model1 = beer.NormalGammaPrior(self.mean, self.precision,
                                        self.prior_count)
@@ -138,6 +193,32 @@ class TestNormalGammaPrior:
         div = beer.kl_div(model1, model2)
         self.assertAlmostEqual(div, 0.)
 
+    def test_batch(self):
+        models = [beer.NormalGammaPrior(self.mean * scale, self.precision,
+                                      self.prior_count * scale)
+                  for scale in [1., 2., 3.]]
+        batch = beer.BatchExpFamilyDensity.from_densities(models)
+        self.assertEqual(len(batch), len(models))
+        for i, model in enumerate(models):
+            self.assertTrue(np.allclose(model.log_norm.numpy(),
+                batch.log_norm[i].numpy(), rtol=TOL, atol=TOL))
+            self.assertTrue(np.allclose(
+                model.expected_sufficient_statistics.numpy(),
+                batch[i].expected_sufficient_statistics.numpy(),
+                rtol=TOL, atol=TOL))
+        kl_divs = beer.kl_div(batch, models[0]).numpy()
+        for i, model in enumerate(models):
+            self.assertAlmostEqual(float(beer.kl_div(model, models[0])),
+                                   float(kl_divs[i]), places=3)
+        kl_divs = beer.pairwise_kl_div(batch, symmetric=False).numpy()
+        sym_kl_divs = beer.pairwise_kl_div(batch).numpy()
+        for i, model1 in enumerate(models):
+            for j, model2 in enumerate(models):
+                kl_div = float(beer.kl_div(model1, model2))
+                self.assertAlmostEqual(kl_div / max(1, abs(kl_div)),
+                    float(kl_divs[i, j]) / max(1, abs(kl_div)), places=3)
+        self.assertTrue(np.allclose(sym_kl_divs, kl_divs + kl_divs.T))
+
     def test_log_norm(self):
         model = beer.NormalGammaPrior(self.mean, self.precision,
                                       self.prior_count)
@@ -160,12 +241,44 @@ class TestNormalWishartPrior:
         s_stats = normalwishart_grad_log_norm(natural_params)
         self.assertTrue(np.allclose(model_s_stats, s_stats, rtol=TOL, atol=TOL))
 
+    def test_autograd_exp_sufficient_statistics(self):
+        model = beer.NormalWishartPrior(self.mean, self.cov, self.prior_count)
+        s_stats1 = model.expected_sufficient_statistics.numpy()
+        s_stats2 = model.autograd_expected_sufficient_statistics().numpy()
+        self.assertTrue(np.allclose(s_stats1, s_stats2, rtol=TOL, atol=TOL))
+
     def test_kl_divergence(self):
         model1 = beer.NormalWishartPrior(self.mean, self.cov, self.prior_count)
         model2 = beer.NormalWishartPrior(self.mean, self.cov, self.prior_count)
         div = beer.kl_div(model1, model2)
         self.assertAlmostEqual(div, 0.)
 
+    def test_batch(self):
+        models = [beer.NormalWishartPrior(self.mean * scale, self.cov,
+                                        self.prior_count * scale)
+                  for scale in [1., 2., 3.]]
+        batch = beer.BatchExpFamilyDensity.from_densities(models)
+        self.assertEqual(len(batch), len(models))
+        for i, model in enumerate(models):
+            self.assertTrue(np.allclose(model.log_norm.numpy(),
+                batch.log_norm[i].numpy(), rtol=TOL, atol=TOL))
+            self.assertTrue(np.allclose(
+                model.expected_sufficient_statistics.numpy(),
+                batch[i].expected_sufficient_statistics.numpy(),
+                rtol=TOL, atol=TOL))
+        kl_divs = beer.kl_div(batch, models[0]).numpy()
+        for i, model in enumerate(models):
+            self.assertAlmostEqual(float(beer.kl_div(model, models[0])),
+                                   float(kl_divs[i]), places=3)
+        kl_divs = beer.pairwise_kl_div(batch, symmetric=False).numpy()
+        sym_kl_divs = beer.pairwise_kl_div(batch).numpy()
+        for i, model1 in enumerate(models):
+            for j, model2 in enumerate(models):
+                kl_div = float(beer.kl_div(model1, model2))
+                self.assertAlmostEqual(kl_div / max(1, abs(kl_div)),
+                    float(kl_divs[i, j]) / max(1, abs(kl_div)), places=3)
+        self.assertTrue(np.allclose(sym_kl_divs, kl_divs + kl_divs.T))
+
     def test_log_norm(self):
         model = beer.NormalWishartPrior(self.mean, self.cov, self.prior_count)
         model_log_norm = model.log_norm.numpy()
@@ -1,11 +1,13 @@
 'Test the features module.'
 
 
+import io
 import sys
 sys.path.insert(0, './')
 import unittest
 import beer
 import numpy as np
+import torch
 from scipy.io.wavfile import read
 
 
@@ -22,7 +24,239 @@ class TestFbank(unittest.TestCase):
         s_t = np.load('tests/audio.npy')
         fea = beer.features.fbank(s_t, nfilters=30, lowfreq=100)
         fea_d_dd = beer.features.add_deltas(fea)
-        self.assertTrue(np.allclose(ref_fea, fea_d_dd))
+        self.assertEqual(fea_d_dd.dtype, beer.precision.compute_dtype(True))
+        # The features are computed in single precision.
+        self.assertTrue(np.allclose(ref_fea, fea_d_dd, atol=1e-5))
+
+    def test_sparse_fbank(self):
+        for nfilters, fft_len in [(26, 512), (80, 1024), (40, 4096)]:
+            for align in [True, False]:
+                dense = beer.features.create_fbank(nfilters, fft_len,
+                    align_filt_center=align)
+                sparse = beer.features.create_fbank(nfilters, fft_len,
+                    align_filt_center=align, sparse=True)
+                self.assertEqual(dense.shape, (nfilters, fft_len // 2))
+                self.assertTrue(np.allclose(dense, sparse.toarray()))
+                self.assertLess(sparse.nnz, 3 * fft_len // 2)
+
+    def test_fbank_extractor(self):
+        s_t = np.load('tests/audio.npy')
+        for dtype in [np.float32, np.float64]:
+            extractor = beer.features.FbankExtractor(nfilters=30,
+                lowfreq=100, dtype=dtype)
+            for signal in [s_t, s_t[:1000], s_t]:
+                ref_fea = beer.features.fbank(signal, nfilters=30,
+                                              lowfreq=100)
+                fea = extractor(signal)
+                self.assertEqual(fea.dtype, dtype)
+                self.assertEqual(fea.shape, ref_fea.shape)
+                self.assertTrue(np.allclose(ref_fea, fea, atol=1e-4))
+            out = np.zeros((extractor.nframes(len(s_t)), 30), dtype=dtype)
+            fea = extractor(s_t, out=out)
+            self.assertTrue(fea is out)
+
+    def test_fbank_torch(self):
+        s_t = np.load('tests/audio.npy')
+        ref_fea = beer.features.fbank(s_t, nfilters=30, lowfreq=100)
+        for dtype in [torch.float32, torch.float64]:
+            signal = torch.from_numpy(s_t).type(dtype)
+            fea = beer.features.fbank_torch(signal, nfilters=30, lowfreq=100)
+            self.assertEqual(fea.dtype, dtype)
+            self.assertTrue(np.allclose(ref_fea, fea.numpy(), atol=1e-4))
+
+        # Batch of signals with autograd.
+        signals = torch.stack([torch.from_numpy(s_t).float()] * 3)
+        signals.requires_grad = True
+        fea = beer.features.fbank_torch(signals, nfilters=30, lowfreq=100)
+        self.assertEqual(fea.size(), (3,) + ref_fea.shape)
+        self.assertTrue(np.allclose(ref_fea, fea[1].data.numpy(), atol=1e-4))
+        fea.sum().backward()
+        self.assertEqual(signals.grad.size(), signals.size())
+
+    def test_deltas_batch(self):
+        fea = np.load('tests/fbank.npy')
+        feas = [fea, fea[:10], fea[:3], fea[:1], fea[5:]]
+        lengths = np.array([len(f) for f in feas])
+        batch = np.zeros((len(feas), len(fea), fea.shape[1]))
+        for i, f in enumerate(feas):
+            batch[i, :len(f)] = f
+        for winlens in [(2, 2), (1,), (3, 2, 1)]:
+            out = np.zeros((len(feas), len(fea), fea.shape[1] * (len(winlens) + 1)))
+            fea_d = beer.features.add_deltas_batch(batch, lengths, winlens,
+                                                   out=out)
+            self.assertTrue(fea_d is out)
+            for i, f in enumerate(feas):
+                ref_fea = beer.features.add_deltas(f, winlens)
+                self.assertTrue(np.allclose(ref_fea, fea_d[i, :len(f)]))
+                self.assertTrue(np.all(fea_d[i, len(f):] == 0))
+
+            # Padded length shorter than the derivatives' context.
+            for nframes in range(1, sum(winlens) + 1):
+                short_batch = batch[:, :nframes]
+                short_lengths = np.minimum(lengths, nframes)
+                fea_d = beer.features.add_deltas_batch(short_batch,
+                                                       short_lengths, winlens)
+                for i, length in enumerate(short_lengths):
+                    ref_fea = beer.features.add_deltas(batch[i, :length],
+                                                       winlens)
+                    self.assertTrue(np.allclose(ref_fea, fea_d[i, :length],
+                                                atol=1e-5))
+                    self.assertTrue(np.all(fea_d[i, length:] == 0))
+
+    def test_online_deltas(self):
+        fea = np.load('tests/fbank.npy')
+        for winlens in [(2, 2), (1,), (3, 2, 1)]:
+            ref_fea = beer.features.add_deltas(fea, winlens)
+            for chunk_size in [1, 4, 100]:
+                deltas = beer.features.OnlineDeltas(winlens)
+                self.assertEqual(deltas.latency, sum(winlens))
+                outputs, nframes = [], 0
+                for i in range(0, len(fea), chunk_size):
+                    outputs.append(deltas(fea[i:i + chunk_size]))
+                    nframes += len(fea[i:i + chunk_size])
+                    self.assertEqual(sum(len(out) for out in outputs),
+                                     max(nframes - deltas.latency, 0))
+                outputs.append(deltas.flush())
+                self.assertTrue(np.allclose(ref_fea, np.vstack(outputs)))
+
+    def test_mean_variance_stats(self):
+        fea = np.load('tests/fbank_d_dd.npy') + 1e4
+        stats1, stats2 = beer.features.MeanVarianceStats(), \
+            beer.features.MeanVarianceStats()
+        for i in range(0, 12, 3):
+            stats1.update(fea[i:i + 3])
+        for i in range(12, len(fea), 4):
+            stats2.update(fea[i:i + 4])
+        stats = beer.features.MeanVarianceStats().merge(stats1).merge(stats2)
+        self.assertEqual(stats.count, len(fea))
+        self.assertTrue(np.allclose(stats.mean, fea.mean(axis=0)))
+        self.assertTrue(np.allclose(stats.var, fea.var(axis=0)))
+
+        ref_fea = (fea - fea.mean(axis=0)) / fea.std(axis=0)
+        norm_fea = stats.normalize(fea)
+        self.assertEqual(norm_fea.dtype,
+                         beer.precision.compute_dtype(numpy=True))
+        self.assertTrue(np.allclose(norm_fea, ref_fea))
+        fea_list = [fea[:10].copy(), fea[10:].copy()]
+        norm_fea = list(stats.normalize_stream(fea_list, inplace=True))
+        self.assertTrue(norm_fea[0] is fea_list[0])
+        self.assertTrue(np.allclose(np.vstack(norm_fea), ref_fea))
+
+    def test_select_frames(self):
+        s_t = np.load('tests/audio.npy')
+        fea = beer.features.fbank(s_t, nfilters=30, lowfreq=100)
+        log_energy = beer.features.frame_log_energy(s_t)
+        self.assertEqual(len(log_energy), len(fea))
+        frame = s_t[160:560].astype(np.float64)
+        self.assertAlmostEqual(log_energy[1], np.log(frame @ frame), places=5)
+
+        log_energy = np.array([0., 0., 10., 10., 10., 0., 0., 0., 10., 0., 0.])
+        mask = beer.features.select_frames(log_energy, threshold=5.,
+            relative=False, hangover=0, min_duration=1)
+        self.assertTrue(np.array_equal(mask, log_energy > 5))
+        mask = beer.features.select_frames(log_energy, threshold=-5.,
+            hangover=1, min_duration=2)
+        self.assertTrue(np.array_equal(np.flatnonzero(mask), [1, 2, 3, 4, 5]))
+        idxs = beer.features.select_frames(log_energy, threshold=-5.,
+            hangover=1, min_duration=2, return_indices=True)
+        self.assertTrue(np.array_equal(idxs, [1, 2, 3, 4, 5]))
+
+        # Utterance shorter than the hangover window.
+        log_energy = np.array([0., 0., 0., 10., 0., 0.])
+        mask = beer.features.select_frames(log_energy, threshold=-5.,
+            hangover=5, min_duration=1)
+        self.assertEqual(len(mask), len(log_energy))
+        self.assertTrue(mask.all())
+        mask = beer.features.select_frames(log_energy, threshold=-5.,
+            hangover=1, min_duration=1)
+        self.assertTrue(np.array_equal(np.flatnonzero(mask), [2, 3, 4]))
+
+    def test_fbank_multi(self):
+        s_t = np.load('tests/audio.npy')
+        configs = {
+            'mel30': {'nfilters': 30, 'lowfreq': 100},
+            'mel': {},
+            'bark': {'nfilters': 20, 'hifreq': 6000,
+                     'hz2scale': beer.features.hz2bark,
+                     'scale2hz': beer.features.bark2hz},
+        }
+        feas = beer.features.fbank_multi(s_t, configs)
+        self.assertEqual(set(feas.keys()), set(configs.keys()))
+        for name, config in configs.items():
+            ref_fea = beer.features.fbank(s_t, **config)
+            self.assertTrue(np.allclose(ref_fea, feas[name]))
+            self.assertTrue(ref_fea.flags['C_CONTIGUOUS'])
+            self.assertTrue(feas[name].flags['C_CONTIGUOUS'])
+        self.assertTrue(np.allclose(np.load('tests/fbank.npy'), feas['mel30']))
+
+    def test_stack_frames(self):
+        fea = np.load('tests/fbank_d_dd.npy')
+        for nframes, step in [(1, 1), (2, None), (3, None), (3, 1), (2, 3)]:
+            stacked = beer.features.stack_frames(fea, nframes, step)
+            step = step or nframes
+            ref_fea = np.array([fea[i:i + nframes].reshape(-1)
+                for i in range(0, len(fea) - nframes + 1, step)])
+            self.assertTrue(np.shares_memory(stacked, fea))
+            self.assertTrue(np.array_equal(ref_fea, stacked))
+            stacked = beer.features.stack_frames(torch.from_numpy(fea),
+                                                 nframes, step)
+            self.assertTrue(np.array_equal(ref_fea, stacked.numpy()))
+
+        # No copy of the raw FBANK features.
+        fea_raw = beer.features.fbank(np.load('tests/audio.npy'))
+        self.assertTrue(np.shares_memory(
+            beer.features.stack_frames(fea_raw, 3), fea_raw))
+
+        batch = np.zeros((2, len(fea), fea.shape[1]))
+        batch[0], batch[1, :10] = fea, fea[:10]
+        stacked, lengths = beer.features.stack_frames(batch, 3, lengths=[23, 10])
+        self.assertTrue(np.array_equal(lengths, [7, 3]))
+        self.assertEqual(stacked.shape, (2, 7, 3 * fea.shape[1]))
+        self.assertTrue(np.array_equal(stacked[0],
+                                       beer.features.stack_frames(fea, 3)))
+        self.assertTrue(np.array_equal(stacked[1, :3],
+                                       beer.features.stack_frames(fea[:10], 3)))
+
+    def test_fbank_stream(self):
+        s_t = np.load('tests/audio.npy')
+        fea = beer.features.fbank(s_t, nfilters=30, lowfreq=100)
+        for chunk_size in [1, 160, 397, 16000, len(s_t)]:
+            chunks = (s_t[i:i + chunk_size]
+                      for i in range(0, len(s_t), chunk_size))
+            fea_stream = np.vstack(list(beer.features.fbank_stream(chunks,
+                nfilters=30, lowfreq=100)))
+            self.assertEqual(fea.shape, fea_stream.shape)
+            self.assertTrue(np.allclose(fea, fea_stream))
+
+    def test_fbank_batch(self):
+        s_t = np.load('tests/audio.npy')
+        signals = [s_t, s_t[:1000], s_t[:100], s_t[500:3777]]
+        feas = beer.features.fbank_batch(signals, nfilters=30, lowfreq=100)
+        packed_fea, lengths = beer.features.fbank_batch(signals, nfilters=30,
+            lowfreq=100, packed=True)
+        self.assertEqual(len(feas), len(signals))
+        self.assertEqual(lengths.sum(), len(packed_fea))
+        for signal, fea, length in zip(signals, feas, lengths):
+            ref_fea = beer.features.fbank(signal, nfilters=30, lowfreq=100) \
+                if len(signal) >= 400 else np.zeros((0, 30))
+            self.assertEqual(ref_fea.shape, fea.shape)
+            self.assertEqual(len(ref_fea), length)
+            self.assertTrue(np.allclose(ref_fea, fea))
+
+    def test_fbank_stream_fileobj(self):
+        s_t = np.load('tests/audio.npy').astype(np.int16)
+        fea = beer.features.fbank(s_t, nfilters=30, lowfreq=100)
+        fileobj = io.BytesIO(s_t.tobytes())
+        fea_stream = np.vstack(list(beer.features.fbank_stream(fileobj,
+            nfilters=30, lowfreq=100)))
+        self.assertTrue(np.allclose(fea, fea_stream))
+
+        # Small reads of float32 samples.
+        fileobj = io.BytesIO(s_t.astype(np.float32).tobytes())
+        outputs = list(beer.features.fbank_stream(fileobj, chunk_size=320,
+            dtype=np.float32, nfilters=30, lowfreq=100))
+        self.assertTrue(all(len(out) <= 2 for out in outputs))
+        self.assertTrue(np.allclose(fea, np.vstack(outputs)))
 
 
 if __name__ == '__main__':
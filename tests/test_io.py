@@ -0,0 +1,202 @@
+'Test the io module.'
+
+
+import os
+import sys
+sys.path.insert(0, './')
+import tempfile
+import unittest
+import unittest.mock
+import beer
+import numpy as np
+import scipy.io.wavfile
+import torch
+
+
+class TestFeatureArchive(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, 'feats')
+        rng = np.random.RandomState(1)
+        self.feas = [('utt{}'.format(i), rng.randn(10 + i, 3).astype(np.float32))
+                     for i in range(4)]
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_read_write(self):
+        beer.io.write_archive(self.path, self.feas)
+        archive = beer.io.FeatureArchive(self.path)
+        self.assertEqual(len(archive), len(self.feas))
+        self.assertEqual(list(archive.keys()), [uttid for uttid, _ in self.feas])
+        for uttid, fea in self.feas:
+            self.assertTrue(uttid in archive)
+            self.assertEqual(archive[uttid].dtype, fea.dtype)
+            self.assertTrue(np.array_equal(archive[uttid], fea))
+            self.assertTrue(np.array_equal(archive.tensor(uttid).numpy(), fea))
+
+    def test_zero_copy(self):
+        beer.io.write_archive(self.path, self.feas)
+        archive = beer.io.FeatureArchive(self.path)
+        fea1, fea2 = archive['utt1'], archive.tensor('utt1')
+        fea1[0, 0] = 100.
+        self.assertEqual(float(fea2[0, 0]), 100.)
+        self.assertTrue(np.array_equal(beer.io.FeatureArchive(self.path)['utt1'],
+                                       self.feas[1][1]))
+
+    def test_frames(self):
+        beer.io.write_archive(self.path, self.feas)
+        frames, first_frames = beer.io.FeatureArchive(self.path).frames()
+        self.assertTrue(np.array_equal(frames,
+                                       np.vstack([fea for _, fea in self.feas])))
+        for uttid, fea in self.feas:
+            start = first_frames[uttid]
+            self.assertTrue(np.array_equal(frames[start:start + len(fea)], fea))
+
+    def test_empty_utterances(self):
+        beer.io.write_archive(self.path, [('x', np.zeros((0, 3), np.float32))])
+        archive = beer.io.FeatureArchive(self.path)
+        self.assertEqual(list(archive.keys()), ['x'])
+        self.assertEqual(archive['x'].shape, (0, 3))
+        self.assertEqual(archive['x'].dtype, np.float32)
+
+    def test_mixed_types(self):
+        feas = [('a', np.ones((3, 3), dtype=np.int16)),
+                ('b', np.ones((2, 5), dtype=np.float64))]
+        beer.io.write_archive(self.path, feas)
+        archive = beer.io.FeatureArchive(self.path)
+        for uttid, fea in feas:
+            self.assertTrue(np.array_equal(archive[uttid], fea))
+        with self.assertRaises(ValueError):
+            archive.frames()
+
+    def test_quantization(self):
+        for qtype in [np.int16, np.uint8]:
+            for per_column in [True, False]:
+                max_error = beer.io.write_archive(self.path, self.feas,
+                    quantize=qtype, per_column=per_column)
+                archive = beer.io.FeatureArchive(self.path)
+                errors = []
+                for uttid, fea in self.feas:
+                    data, params = archive.raw(uttid)
+                    self.assertEqual(data.dtype, qtype)
+                    self.assertEqual(params.shape, (2, fea.shape[1]))
+                    self.assertEqual(archive[uttid].dtype, np.float32)
+                    error = np.abs(archive[uttid] - fea).max()
+                    bound = .5 * params[1].max() * (1 + 1e-3)
+                    self.assertLessEqual(error, bound)
+                    errors.append(error)
+                    chunks = list(archive.chunks(uttid, chunk_size=3))
+                    self.assertEqual(len(chunks), (len(fea) + 2) // 3)
+                    self.assertTrue(np.array_equal(np.vstack(chunks),
+                                                   archive[uttid]))
+                self.assertAlmostEqual(max_error, max(errors), places=5)
+                with self.assertRaises(ValueError):
+                    archive.frames()
+
+    def test_duplicate(self):
+        with beer.io.FeatureArchiveWriter(self.path) as writer:
+            writer.write('a', np.ones((2, 2)))
+            with self.assertRaises(ValueError):
+                writer.write('a', np.ones((2, 2)))
+
+
+class TestFeatureCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.s_t = np.load('tests/audio.npy')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_key(self):
+        cache = beer.io.FeatureCache(self.tmpdir.name)
+        key = cache.key(self.s_t)
+        self.assertEqual(key, cache.key(self.s_t.copy()))
+        self.assertEqual(key, cache.key(self.s_t, nfilters=26))
+        self.assertNotEqual(key, cache.key(self.s_t, nfilters=30))
+        self.assertNotEqual(key, cache.key(self.s_t, winlens=(2, 2)))
+        self.assertNotEqual(key, cache.key(self.s_t,
+            hz2scale=beer.features.hz2bark, scale2hz=beer.features.bark2hz))
+        self.assertNotEqual(key, cache.key(self.s_t[1:]))
+        with beer.precision.precision(compute='float64'):
+            self.assertNotEqual(key, cache.key(self.s_t))
+
+    def test_extract(self):
+        cache = beer.io.FeatureCache(self.tmpdir.name)
+        ref_fea = beer.features.add_deltas(beer.features.fbank(self.s_t,
+            nfilters=30, lowfreq=100))
+        fea1 = cache.extract(self.s_t, (2, 2), nfilters=30, lowfreq=100)
+        self.assertTrue(np.allclose(ref_fea, fea1))
+        key = cache.key(self.s_t, (2, 2), nfilters=30, lowfreq=100)
+        self.assertTrue(np.array_equal(cache.load(key), ref_fea))
+        fea2 = beer.io.FeatureCache(self.tmpdir.name).extract(self.s_t,
+            (2, 2), nfilters=30, lowfreq=100)
+        self.assertTrue(np.array_equal(fea1, fea2))
+        with beer.precision.precision(compute='float64'):
+            fea3 = cache.extract(self.s_t, (2, 2), nfilters=30, lowfreq=100)
+        self.assertEqual(fea3.dtype, np.float64)
+
+    def test_eviction(self):
+        fea = np.zeros((10, 10))
+        cache = beer.io.FeatureCache(self.tmpdir.name, max_size=3 * fea.nbytes + 500)
+        for i in range(3):
+            cache.store(str(i), fea)
+            path = os.path.join(self.tmpdir.name, '{}.npy'.format(i))
+            os.utime(path, (i, i))
+        cache.load('0')
+        cache.store('3', fea)
+        self.assertIsNone(cache.load('1'))
+        for key in ['0', '2', '3']:
+            self.assertIsNotNone(cache.load(key))
+
+    def test_eviction_scans(self):
+        fea = np.zeros((10, 10))
+        cache = beer.io.FeatureCache(self.tmpdir.name,
+            max_size=20 * fea.nbytes, scan_every=8)
+        with unittest.mock.patch.object(cache, '_evict',
+                                        wraps=cache._evict) as evict:
+            for i in range(16):
+                cache.store(str(i), fea)
+            # First store (unknown size) and 8 stores later.
+            self.assertEqual(evict.call_count, 2)
+            for i in range(16, 40):
+                cache.store(str(i), fea)
+        npy_files = [name for name in os.listdir(self.tmpdir.name)
+                     if name.endswith('.npy')]
+        self.assertLessEqual(len(npy_files), 20)
+
+
+class TestReadSegment(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.s_t = np.load('tests/audio.npy')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_read_segment(self):
+        wav_path = os.path.join(self.tmpdir.name, 'audio.wav')
+        scipy.io.wavfile.write(wav_path, 16000, self.s_t)
+        pcm_path = os.path.join(self.tmpdir.name, 'audio.pcm')
+        self.s_t.tofile(pcm_path)
+        ref_fea = beer.features.fbank(self.s_t)
+        for path in [wav_path, pcm_path]:
+            for start, end, first, last in [(0., None, 0, 23), (.05, .12, 5, 12),
+                                            (0.1, 10., 10, 23), (.2, .1, 0, 0)]:
+                signal, prev_sample = beer.io.read_segment(path, start, end)
+                if first == 0:
+                    self.assertIsNone(prev_sample)
+                if last == first:
+                    self.assertEqual(len(signal), 0)
+                    continue
+                fea = beer.features.fbank(signal, prev_sample=prev_sample)
+                self.assertEqual(len(fea), last - first)
+                self.assertTrue(np.allclose(ref_fea[first:last], fea))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,7 @@
 'Test the Mixture model.'
 
 
+import copy
 import sys
 sys.path.insert(0, './')
 import unittest
@@ -45,6 +46,10 @@ class TestMixture:
         exp_llh2 = exp_llh2.numpy()
         self.assertTrue(np.allclose(exp_llh1.astype(exp_llh2.dtype), exp_llh2,
              atol=TOL))
+        self.assertTrue(np.allclose(acc_stats1[0], acc_stats2[0].numpy(),
+             rtol=TOL, atol=TOL))
+        self.assertTrue(np.allclose(acc_stats1[1], acc_stats2[1].numpy(),
+             rtol=TOL, atol=TOL))
 
     def test_kl_div_posterior_prior(self):
         model = beer.Mixture.create(self.prior_counts, self.comp_type.create,
@@ -73,6 +78,36 @@ class TestMixture:
         nparams2 = model.posterior_weights.natural_params.numpy()
         self.assertTrue(np.allclose(nparams1, nparams2, atol=TOL))
 
+    def test_natural_grad_update_components(self):
+        model = beer.Mixture.create(self.prior_counts, self.comp_type.create,
+            self.args)
+        components = copy.deepcopy(model).components
+        _, acc_stats = model.exp_llh(self.X, accumulate=True)
+        model.natural_grad_update(acc_stats, .5, .1)
+        for i, component in enumerate(components):
+            component.natural_grad_update(acc_stats[0][i], .5, .1)
+            self.assertTrue(np.allclose(
+                component.posterior.natural_params.numpy(),
+                model.components[i].posterior.natural_params.numpy(),
+                atol=TOL))
+            self.assertTrue(np.allclose(
+                component.posterior.expected_sufficient_statistics.numpy(),
+                model._np_params_matrix[i, :-1].numpy(), atol=TOL))
+
+    def test_np_params_matrix_version(self):
+        model = beer.Mixture.create(self.prior_counts, self.comp_type.create,
+            self.args)
+        matrix1 = model._np_params_matrix
+        self.assertTrue(model._np_params_matrix is matrix1)
+        component = model.components[-1]
+        component.posterior.natural_params = \
+            2 * component.posterior.natural_params
+        matrix2 = model._np_params_matrix
+        self.assertFalse(matrix2 is matrix1)
+        self.assertTrue(np.allclose(
+            component.posterior.expected_sufficient_statistics.numpy(),
+            matrix2[-1, :-1].numpy(), atol=TOL))
+
     def test_split(self):
         model = beer.Mixture.create(self.prior_counts, self.comp_type.create,
             self.args)
@@ -88,6 +123,41 @@ class TestMixture:
         self.assertTrue(np.allclose(model2.posterior_weights.natural_params.numpy(),
             post_np, atol=TOL))
 
+    def test_merge(self):
+        model = beer.Mixture.create(self.prior_counts, self.comp_type.create,
+            self.args)
+        if len(model.components) < 2:
+            return
+        _, acc_stats = model.exp_llh(self.X, accumulate=True)
+        model.natural_grad_update(acc_stats, 1., 1.)
+        n_components = len(model.components)
+        kl_divs = beer.pairwise_kl_div(model._posteriors).numpy()
+        kl_divs[np.tril_indices(n_components)] = np.inf
+        i, j = np.unravel_index(np.argmin(kl_divs), kl_divs.shape)
+
+        model2 = model.merge(n_merges=1)
+        self.assertEqual(len(model2.components), n_components - 1)
+        w_np = model.posterior_weights.natural_params.numpy()
+        w_np2 = model2.posterior_weights.natural_params.numpy()
+        self.assertAlmostEqual(float(w_np2[i]), float(w_np[i] + w_np[j]),
+                               places=TOLPLACES)
+        self.assertAlmostEqual(float(w_np.sum()), float(w_np2.sum()),
+                               places=TOLPLACES)
+        prior_np = model.components[i].prior.natural_params.numpy()
+        post_np1 = model.components[i].posterior.natural_params.numpy()
+        post_np2 = model.components[j].posterior.natural_params.numpy()
+        self.assertTrue(np.allclose(
+            model2.components[i].posterior.natural_params.numpy(),
+            post_np1 + post_np2 - prior_np, atol=TOL))
+
+        model3 = model.merge()
+        self.assertEqual(len(model3.components),
+                         n_components - n_components // 2)
+        model4 = model.merge(n_merges=n_components + 2)
+        self.assertEqual(len(model4.components),
+                         n_components - n_components // 2)
+        self.assertTrue(model.merge(max_div=-1.) is model)
+
     def test_expected_natural_params(self):
         model = beer.Mixture.create(self.prior_counts, self.comp_type.create,
             self.args)
@@ -221,6 +291,18 @@ gmm_diag4D = {
 }
 
 
+gmm_diag5F = {
+    **dataF,
+    'prior_counts': torch.ones(3).float(),
+    'comp_type': beer.NormalDiagonalCovariance,
+    'args': {
+        'prior_mean': torch.zeros(2).float(),
+        'prior_cov': torch.eye(2).float(),
+        'prior_count': 1,
+        'random_init': True
+    }
+}
+
 gmm_full1F = {
     **dataF,
     'prior_counts': torch.ones(10).float(),
@@ -303,6 +385,7 @@ tests = [
     (TestMixture, gmm_diag3D),
     (TestMixture, gmm_diag4F),
     (TestMixture, gmm_diag4D),
+    (TestMixture, gmm_diag5F),
     (TestMixture, gmm_full1F),
     (TestMixture, gmm_full1D),
     (TestMixture, gmm_full2F),
@@ -67,8 +67,9 @@ class TestNormalDiagonalCovariance:
     def test_exp_llh(self):
         model = beer.NormalDiagonalCovariance.create(self.mean, self.cov,
             self.prior_count)
-        T = model.sufficient_statistics(self.X)
-        nparams = model.posterior.expected_sufficient_statistics
+        T = model.sufficient_statistics(
+            self.X.to(beer.precision.compute_dtype()))
+        nparams = model.posterior.expected_sufficient_statistics.to(T.dtype)
         exp_llh1 = T @ nparams
         exp_llh1 -= .5 * self.X.size(1) * math.log(2 * math.pi)
         s1 = T.sum(dim=0)
@@ -78,6 +79,18 @@ class TestNormalDiagonalCovariance:
         self.assertTrue(np.allclose(s1.numpy(), s2.numpy(), rtol=TOL,
                         atol=TOL))
 
+    def test_exp_llh_mask(self):
+        model = beer.NormalDiagonalCovariance.create(self.mean, self.cov,
+            self.prior_count)
+        mask = np.arange(self.X.size(0)) % 3 == 0
+        exp_llh1, s1 = model.exp_llh(self.X[torch.from_numpy(mask)],
+                                     accumulate=True)
+        exp_llh2, s2 = model.exp_llh(self.X, accumulate=True, mask=mask)
+        self.assertEqual(len(exp_llh2), mask.sum())
+        self.assertTrue(np.allclose(exp_llh1.numpy(), exp_llh2.numpy(),
+                        atol=TOL))
+        self.assertTrue(np.allclose(s1.numpy(), s2.numpy(), atol=TOL))
+
     def test_split(self):
         model = beer.NormalDiagonalCovariance.create(self.mean, self.cov,
             self.prior_count)
@@ -133,7 +146,8 @@ class TestNormalFullCovariance:
 
     def test_sufficient_statistics(self):
         X = self.X.numpy()
-        s1 = np.c_[(X[:, :, None] * X[:, None, :]).reshape(len(X), -1),
+        rows, cols = np.triu_indices(X.shape[1])
+        s1 = np.c_[(X[:, :, None] * X[:, None, :])[:, rows, cols],
             X, np.ones(len(X)), np.ones(len(X))]
         s2 = beer.NormalFullCovariance.sufficient_statistics(self.X)
         self.assertTrue(np.allclose(s1, s2.numpy(), atol=TOL))
@@ -144,17 +158,18 @@ class TestNormalFullCovariance:
         s1 = beer.NormalFullCovariance.sufficient_statistics_from_mean_var(
             mean, var)
         mean, var = mean.numpy(), var.numpy()
-        idxs = np.identity(mean.shape[1]).reshape(-1) == 1
-        XX = (mean[:, :, None] * mean[:, None, :]).reshape(mean.shape[0], -1)
-        XX[:, idxs] += var
+        rows, cols = np.triu_indices(mean.shape[1])
+        XX = (mean[:, :, None] * mean[:, None, :])[:, rows, cols]
+        XX[:, rows == cols] += var
         s2 = np.c_[XX, mean, np.ones(len(mean)), np.ones(len(mean))]
         self.assertTrue(np.allclose(s1.numpy(), s2, atol=TOL))
 
     def test_exp_llh(self):
         model = beer.NormalFullCovariance.create(self.mean, self.cov,
             self.prior_count)
-        T = model.sufficient_statistics(self.X)
-        nparams = model.posterior.expected_sufficient_statistics
+        T = model.sufficient_statistics(
+            self.X.to(beer.precision.compute_dtype()))
+        nparams = model.posterior.expected_sufficient_statistics.to(T.dtype)
         exp_llh1 = T @ nparams
         exp_llh1 -= .5 * self.X.size(1) * math.log(2 * math.pi)
         s1 = T.sum(dim=0)
@@ -163,6 +178,26 @@ class TestNormalFullCovariance:
                         atol=TOL))
         self.assertTrue(np.allclose(s1.numpy(), s2.numpy(), atol=TOL))
 
+    def test_exp_llh_quadratic_form(self):
+        models = [beer.NormalFullCovariance.create(self.mean, self.cov,
+            self.prior_count, random_init=True) for _ in range(3)]
+        X = self.X.double()
+        nparams = torch.stack([model.posterior.expected_sufficient_statistics
+                               for model in models]).double()
+        weights = torch.rand(len(X), len(models)).double()
+        T = beer.NormalFullCovariance.sufficient_statistics(X)
+        exp_llh1, s1 = T @ nparams.t(), weights.t() @ T
+        exp_llh2 = beer.NormalFullCovariance._exp_llh_matrix(X, nparams)
+        s2 = beer.NormalFullCovariance._accumulate(X, weights)
+        self.assertTrue(np.allclose(exp_llh1.numpy(), exp_llh2.numpy(),
+                        rtol=TOL, atol=TOL))
+        self.assertTrue(np.allclose(s1.numpy(), s2.numpy(), rtol=TOL,
+                        atol=TOL))
+        # A single component uses the quadratic form.
+        exp_llh3 = beer.NormalFullCovariance._exp_llh_matrix(X, nparams[:1])
+        self.assertTrue(np.allclose(exp_llh1[:, :1].numpy(), exp_llh3.numpy(),
+                        rtol=TOL, atol=TOL))
+
     def test_split(self):
         model = beer.NormalFullCovariance.create(self.mean, self.cov,
             self.prior_count)
@@ -182,8 +217,11 @@ class TestNormalFullCovariance:
         var = torch.diag(self.cov).view(1, -1)
         enp1, Ts1 = model.expected_natural_params(mean, var)
         T = model.sufficient_statistics_from_mean_var(mean, var).numpy()
-        enp2, Ts2 = model.posterior.expected_sufficient_statistics.numpy(), \
-             T.sum(axis=0)
+        D = mean.shape[1]
+        exp_stats = model.posterior.expected_sufficient_statistics.numpy()
+        np1 = -.5 * np.linalg.inv(model.cov.numpy())
+        enp2 = np.r_[np1.reshape(-1), exp_stats[-D - 2:]][None, :]
+        Ts2 = T.sum(axis=0)
         self.assertTrue(np.allclose(enp1.numpy(), enp2, atol=TOL))
         self.assertTrue(np.allclose(Ts1.numpy(), Ts2, atol=TOL))
 
@@ -0,0 +1,71 @@
+'Test the online module.'
+
+
+import sys
+sys.path.insert(0, './')
+import unittest
+import beer
+import numpy as np
+import torch
+
+
+torch.manual_seed(10)
+
+
+class TestOnlineScorer(unittest.TestCase):
+
+    def setUp(self):
+        self.s_t = np.load('tests/audio.npy')
+        self.fea = beer.features.add_deltas(beer.features.fbank(self.s_t))
+        dim = self.fea.shape[1]
+        self.model = beer.Mixture.create(torch.ones(4).double(),
+            beer.NormalDiagonalCovariance.create, {
+                'prior_mean': torch.zeros(dim).double(),
+                'prior_cov': torch.eye(dim).double() * 10,
+                'prior_count': 1.,
+                'random_init': True
+            })
+
+    def test_scorer(self):
+        # The streaming and offline features are compared in double
+        # precision, single precision rounding of the log-likelihoods
+        # depends on the number of frames processed at once.
+        with beer.precision.precision(compute='float64'):
+            fea = beer.features.add_deltas(beer.features.fbank(self.s_t))
+            exp_llh1, resps1 = self.model.responsibilities(
+                torch.from_numpy(fea))
+            for chunk_size in [160, 1000]:
+                scorer = beer.online.OnlineScorer(self.model)
+                exp_llhs, resps = [], []
+                for i in range(0, len(self.s_t), chunk_size):
+                    exp_llh, resp = scorer(self.s_t[i:i + chunk_size])
+                    exp_llhs.append(exp_llh)
+                    resps.append(resp)
+                exp_llh, resp = scorer.flush()
+                exp_llhs.append(exp_llh)
+                resps.append(resp)
+                exp_llh2, resps2 = torch.cat(exp_llhs), torch.cat(resps)
+                self.assertTrue(np.allclose(exp_llh1.numpy(), exp_llh2.numpy()))
+                self.assertTrue(np.allclose(resps1.numpy(), resps2.numpy()))
+                self.assertEqual(scorer.nframes, len(fea))
+                self.assertEqual(set(scorer.time_per_frame().keys()),
+                                 {'fbank', 'deltas', 'model'})
+
+    def test_latency(self):
+        scorer = beer.online.OnlineScorer(self.model)
+        self.assertEqual(scorer.latency, 400 + 4 * 160)
+        exp_llh, _ = scorer(self.s_t[:scorer.latency - 1])
+        self.assertEqual(len(exp_llh), 0)
+        exp_llh, _ = scorer(self.s_t[scorer.latency - 1:scorer.latency])
+        self.assertEqual(len(exp_llh), 1)
+
+    def test_normalization(self):
+        stats = beer.features.MeanVarianceStats().update(self.fea)
+        scorer = beer.online.OnlineScorer(self.model, stats=stats)
+        exp_llh1 = torch.cat([scorer(self.s_t)[0], scorer.flush()[0]])
+        exp_llh2 = self.model.exp_llh(torch.from_numpy(stats.normalize(self.fea)))
+        self.assertTrue(np.allclose(exp_llh1.numpy(), exp_llh2.numpy()))
+
+
+if __name__ == '__main__':
+    unittest.main()
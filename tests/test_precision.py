@@ -0,0 +1,57 @@
+'Test the precision module.'
+
+
+import sys
+sys.path.insert(0, './')
+import unittest
+import beer
+import numpy as np
+import torch
+
+
+class TestPrecision(unittest.TestCase):
+
+    def test_precision(self):
+        self.assertEqual(beer.precision.compute_dtype(), torch.float32)
+        self.assertEqual(beer.precision.stats_dtype(), torch.float64)
+        with beer.precision.precision(compute='float64', stats=np.float32):
+            self.assertEqual(beer.precision.compute_dtype(), torch.float64)
+            self.assertEqual(beer.precision.compute_dtype(numpy=True),
+                             np.float64)
+            self.assertEqual(beer.precision.stats_dtype(), torch.float32)
+        self.assertEqual(beer.precision.compute_dtype(), torch.float32)
+        self.assertEqual(beer.precision.stats_dtype(numpy=True), np.float64)
+
+    def test_features(self):
+        s_t = np.load('tests/audio.npy')
+        fea = beer.features.fbank(s_t)
+        self.assertEqual(fea.dtype, np.float32)
+        self.assertEqual(beer.features.add_deltas(fea).dtype, np.float32)
+        with beer.precision.precision(compute=torch.float64):
+            self.assertEqual(beer.features.fbank(s_t).dtype, np.float64)
+
+    def test_models(self):
+        X = torch.randn(20, 3).double()
+        model = beer.Mixture.create(torch.ones(2),
+            beer.NormalDiagonalCovariance.create, {
+                'prior_mean': torch.zeros(3),
+                'prior_cov': torch.ones(3),
+                'random_init': True
+            })
+        self.assertEqual(model.posterior_weights.natural_params.dtype,
+                         torch.float64)
+        self.assertEqual(model.components[0].posterior.natural_params.dtype,
+                         torch.float64)
+        exp_llh, (comp_stats, weights_stats) = model.exp_llh(X, accumulate=True)
+        self.assertEqual(exp_llh.dtype, torch.float32)
+        self.assertEqual(comp_stats.dtype, torch.float64)
+        self.assertEqual(weights_stats.dtype, torch.float64)
+        with beer.precision.precision(compute=torch.float64):
+            exp_llh64 = model.exp_llh(X)
+            self.assertEqual(exp_llh64.dtype, torch.float64)
+        self.assertTrue(np.allclose(exp_llh.numpy(), exp_llh64.numpy(),
+                                    atol=1e-4))
+
+
+if __name__ == '__main__':
+    unittest.main()
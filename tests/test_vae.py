@@ -0,0 +1,95 @@
+'Test the VAE model.'
+
+
+import sys
+sys.path.insert(0, './')
+import unittest
+import numpy as np
+import beer
+import torch
+from torch import nn
+
+
+TOLPLACES = 4
+TOL = 10 ** (-TOLPLACES)
+
+
+class TestVAE:
+
+    def create_vae(self):
+        encoder = beer.models.MLPNormalDiag(
+            nn.Sequential(nn.Linear(self.X.size(1), 10), nn.Tanh()),
+            self.latent_dim)
+        decoder = beer.models.MLPNormalIso(
+            nn.Sequential(nn.Linear(self.latent_dim, 10), nn.Tanh()),
+            self.X.size(1))
+        return beer.models.VAE(encoder, decoder, self.latent_model(), 2)
+
+    def test_forward_loss(self):
+        vae = self.create_vae()
+        state = vae(self.X)
+        loss, llh, kld = vae.loss(self.X, state)
+        self.assertEqual(loss.shape, (self.X.size(0), 1))
+        self.assertEqual(kld.shape, (self.X.size(0),))
+        self.assertTrue(np.all(np.isfinite(loss.detach().numpy())))
+        loss.sum().backward()
+
+    def test_expected_natural_params(self):
+        vae = self.create_vae()
+        if isinstance(vae.latent_model, beer.Mixture):
+            self.skipTest('No single posterior for a mixture.')
+        state = vae(self.X)
+        D = self.latent_dim
+        nparams = state['p_np_params'].double()
+        self.assertEqual(nparams.size(-1), D ** 2 + D + 2)
+
+        # The inner product with the statistics of the encoder state
+        # (full (D x D) layout) matches the one with the statistics of
+        # the latent model (own layout).
+        encoder_state = state['encoder_state']
+        mean = encoder_state.mean.data.double()
+        var = 1 / encoder_state.prec.data.double()
+        T = vae.latent_model.sufficient_statistics_from_mean_var(mean, var)
+        exp_nparams = vae.latent_model.posterior.expected_sufficient_statistics
+        inner1 = T @ exp_nparams
+        exp_T = encoder_state.exp_T().detach().double()
+        inner2 = (exp_T * nparams).sum(dim=-1)
+        self.assertTrue(np.allclose(inner1.numpy(), inner2.numpy(),
+                                    rtol=TOL, atol=TOL))
+
+
+def full_covariance():
+    return beer.NormalFullCovariance.create(torch.zeros(2),
+        torch.FloatTensor([[2, -1.2], [-1.2, 10.]]), 1., random_init=True)
+
+
+def diagonal_covariance():
+    return beer.NormalDiagonalCovariance.create(torch.zeros(2),
+        torch.eye(2), 1., random_init=True)
+
+
+def mixture_full_covariance():
+    return beer.Mixture.create(torch.ones(3) / 3,
+        beer.NormalFullCovariance.create,
+        {'prior_mean': torch.zeros(2), 'prior_cov': torch.eye(2),
+         'prior_count': 1., 'random_init': True})
+
+
+data = {'X': torch.randn(20, 5).float(), 'latent_dim': 2}
+
+
+tests = [
+    (TestVAE, {'latent_model': staticmethod(full_covariance), **data}),
+    (TestVAE, {'latent_model': staticmethod(diagonal_covariance), **data}),
+    (TestVAE, {'latent_model': staticmethod(mixture_full_covariance),
+               **data}),
+]
+
+
+module = sys.modules[__name__]
+for i, test in enumerate(tests, start=1):
+    name = test[0].__name__ + 'Test' + str(i)
+    setattr(module, name, type(name, (unittest.TestCase, test[0]),  test[1]))
+
+if __name__ == '__main__':
+    unittest.main()